@@ -0,0 +1,86 @@
+"""Micro-benchmark du découpage des lignes IRC (split_irc_line).
+
+Compare l'ancien découpage caractère par caractère (quadratique) avec la version
+actuelle, sur de longues réponses multilingues et chargées en emojis, et vérifie
+que les deux produisent exactement les mêmes morceaux.
+
+Utilisation :
+    python bench_line_splitter.py [nombre_de_répétitions]
+"""
+import random
+import sys
+import timeit
+
+from irc_bot_ollama import IRC_MAX_LINE_BYTES, split_irc_line
+
+
+def legacy_split_irc_line(line: str, max_bytes: int = IRC_MAX_LINE_BYTES):
+    """Ancienne implémentation de `_send_message_with_rate_limit`, gardée comme référence."""
+    remaining_line = line
+    while len(remaining_line.encode('utf-8')) > max_bytes:
+        temp_line = ""
+        last_space_idx = -1
+        for i, char_ in enumerate(remaining_line):
+            temp_line_bytes = (temp_line + char_).encode('utf-8')
+            if len(temp_line_bytes) > max_bytes:
+                break
+            temp_line += char_
+            if char_ == ' ':
+                last_space_idx = i
+
+        if last_space_idx != -1 and len(temp_line.encode('utf-8')) > max_bytes * 0.75:
+            part = remaining_line[:last_space_idx]
+            remaining_line = remaining_line[last_space_idx+1:].lstrip()
+        else:
+            idx_byte_limit = 0
+            current_byte_len = 0
+            for i, char_ in enumerate(remaining_line):
+                char_byte_len = len(char_.encode('utf-8'))
+                if current_byte_len + char_byte_len > max_bytes:
+                    break
+                current_byte_len += char_byte_len
+                idx_byte_limit = i + 1
+            part = remaining_line[:idx_byte_limit]
+            remaining_line = remaining_line[idx_byte_limit:].lstrip()
+        yield part
+
+    if remaining_line:
+        yield remaining_line
+
+
+WORDS = [
+    "bonjour", "réponse", "modèle", "contexte", "déjà", "où", "garçon", "naïve",
+    "привет", "модель", "こんにちは", "モデル", "你好", "模型", "안녕하세요", "مرحبا", "नमस्ते",
+    "🙂", "🚀", "🤖", "👩‍💻", "🇫🇷", "❤️", "🎉🎉🎉",
+]
+# Séparateurs avec espaces Unicode (insécable, idéographique, fine) : à retirer en début de morceau comme str.lstrip
+SEPARATORS = [" ", " ", " \u00a0", " \u3000\u3000", "\u202f \u2009", " \u00a0\t"]
+
+
+def make_samples(rng: random.Random):
+    """Retourne des lignes de test : texte multilingue, emojis seuls, texte sans espaces et espaces Unicode."""
+    multilingual = " ".join(rng.choice(WORDS) for _ in range(4000))
+    emoji_heavy = " ".join("".join(rng.choice(WORDS[-7:]) for _ in range(rng.randint(1, 6))) for _ in range(2000))
+    no_spaces = "".join(rng.choice(WORDS) for _ in range(3000))
+    unicode_spaces = "".join(rng.choice(WORDS) + rng.choice(SEPARATORS) for _ in range(4000))
+    return {"multilingue": multilingual, "emojis": emoji_heavy, "sans espaces": no_spaces, "espaces Unicode": unicode_spaces}
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    samples = make_samples(random.Random(42))
+
+    for name, line in samples.items():
+        new_parts = list(split_irc_line(line))
+        legacy_parts = list(legacy_split_irc_line(line))
+        assert new_parts == legacy_parts, f"Résultats différents pour l'échantillon '{name}'"
+        assert all(len(part.encode('utf-8')) <= IRC_MAX_LINE_BYTES for part in new_parts)
+
+        new_time = min(timeit.repeat(lambda: list(split_irc_line(line)), number=1, repeat=repeat))
+        legacy_time = min(timeit.repeat(lambda: list(legacy_split_irc_line(line)), number=1, repeat=repeat))
+        print(f"{name:>15}: {len(line.encode('utf-8')):>7} octets, {len(new_parts):>4} lignes | "
+              f"ancien {legacy_time * 1000:9.2f} ms | nouveau {new_time * 1000:7.2f} ms | x{legacy_time / new_time:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
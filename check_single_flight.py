@@ -0,0 +1,71 @@
+"""Vérification de la fusion des requêtes identiques (SingleFlight, `coalesce_requests`).
+
+Deux utilisateurs posent coup sur coup la même question au bot dans le même canal :
+un faux serveur Ollama local doit recevoir une seule requête, et chacun doit recevoir
+sa réponse. Une même question posée dans un autre canal part, elle, séparément.
+
+Utilisation :
+    python check_single_flight.py
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from irc.client import Event, NickMask
+
+import irc_bot_ollama
+
+ANSWER = "Il est midi."
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    """Répond lentement à /api/chat, pour que la seconde question arrive pendant la génération."""
+    calls = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/api/chat":
+            FakeOllama.calls.append(payload)
+            time.sleep(0.3)
+        body = json.dumps({"message": {"role": "assistant", "content": ANSWER}, "done": True}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    irc_bot_ollama.config = {"irc": {}, "ollama": {
+        "api_url": f"http://127.0.0.1:{server.server_port}/api/chat", "model": "test",
+        "stream_responses": False, "keep_warm": False, "response_cache": {"enabled": False}}}
+
+    bot = irc_bot_ollama.OllamaIRCBot(["#a", "#b"], "skynetBot", "localhost", 6667)
+    sent = []
+    connection = bot.connection
+    connection.real_nickname = "skynetBot"
+    connection.is_connected = lambda: True
+    connection.privmsg = lambda target, text: sent.append((target, text))
+    bot.outbound.rate = 100.0
+
+    for nick, channel in (("alice", "#a"), ("bob", "#a"), ("carol", "#b")):
+        bot.on_pubmsg(connection, Event("pubmsg", NickMask(f"{nick}!u@h"), channel, ["skynetBot: quelle heure est-il ?"]))
+    deadline = time.monotonic() + 5
+    while len(sent) < 3 and time.monotonic() < deadline:
+        bot.reactor.process_once(0.05)
+    server.shutdown()
+
+    assert len(FakeOllama.calls) == 2, f"{len(FakeOllama.calls)} générations au lieu de 2 (une par canal)"
+    assert bot.single_flight.coalesced == 1, f"{bot.single_flight.coalesced} requête(s) fusionnée(s) au lieu de 1"
+    assert sorted(sent) == [("#a", f"alice: {ANSWER}"), ("#a", f"bob: {ANSWER}"), ("#b", f"carol: {ANSWER}")], sent
+    print(f"OK : {len(FakeOllama.calls)} générations pour 3 questions, réponses : {sent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,38 @@ import irc.bot
 import irc.strings
 from irc.client import ip_numstr_to_quad, ip_quad_to_numstr, Event, ServerConnection, NickMask
 import json
+import re
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import logging
 import ssl # Pour la connexion SSL
 import random
+import sys
+import itertools
+import os
+import atexit
+import signal
+import fnmatch
+import hashlib
+import base64
+import bisect
+import sqlite3
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from functools import partial
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+try:
+    import numpy as np # Optionnel : uniquement pour la mémoire à long terme (ollama.long_term_memory)
+except ImportError:
+    np = None
 
 # --- Configuration et Logging ---
 CONFIG_FILE = "config.json"
 config = {}
-conversation_history = {} # Pour stocker l'historique par canal { "canal": [{"role": "user/assistant", "name": "nick", "content": "message"}, ...]}
 
 def load_config():
     global config
@@ -26,52 +47,2150 @@ def load_config():
         logging.critical(f"Erreur: Le fichier de configuration '{CONFIG_FILE}' n'est pas un JSON valide. Détails: {e}")
         exit(1)
 
+class ChannelSamplingFilter(logging.Filter):
+    """Ne garde qu'une fraction des logs de messages des canaux très actifs.
+
+    Ne concerne que les enregistrements portant un attribut `channel` (passé via `extra`) ;
+    `rates` associe un canal (ou "*" pour tous les canaux) à la proportion de logs à garder.
+    """
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = {channel.lower(): float(rate) for channel, rate in rates.items()}
+
+    def filter(self, record) -> bool:
+        channel = getattr(record, "channel", None)
+        if channel is None or not self.rates:
+            return True
+        rate = self.rates.get(channel.lower(), self.rates.get("*", 1.0))
+        return rate >= 1 or random.random() < rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler qui laisse le formatage au thread d'écriture.
+
+    Le QueueHandler standard formate le message avant de le mettre en file (pour pouvoir l'envoyer
+    à un autre processus) ; ici la file reste dans le processus, l'enregistrement est donc transmis
+    tel quel et c'est le QueueListener qui paie le formatage et les écritures.
+    """
+    def prepare(self, record):
+        return record
+
+
+log_listener = None # QueueListener qui écrit les logs en arrière-plan (voir setup_logging)
+
 def setup_logging():
+    global log_listener
     bot_settings = config.get("bot_settings", {})
-    log_level_str = bot_settings.get("log_level", "INFO").upper()
     log_file = bot_settings.get("log_file", "ollama_irc_bot.log")
-    log_level = getattr(logging, log_level_str, logging.INFO)
-    log_level = logging.DEBUG 
-    logging.getLogger("irc.client").setLevel(logging.DEBUG)
-    
-    logging.basicConfig(
-        level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
-    # Réduire la verbosité de la bibliothèque IRC si on est en INFO ou plus haut
-    # if log_level <= logging.INFO: # Temporairement commenter ou ajuster pour voir les logs DEBUG d'IRC
-    #     logging.getLogger("irc.client").setLevel(logging.WARNING)
-    # else:
-    #     logging.getLogger("irc.client").setLevel(log_level) # Ou fixez-le à DEBUG
-    
-    # Pour voir TOUS les messages de la bibliothèque IRC, y compris les données brutes :
-    logging.getLogger("irc.client").setLevel(logging.DEBUG) # <<< MODIFICATION IMPORTANTE
+
+    # Rotation par taille (par défaut) ou dans le temps ("mode": "time")
+    rotation = bot_settings.get("log_rotation", {})
+    if rotation.get("mode", "size") == "time":
+        file_handler = TimedRotatingFileHandler(log_file, when=rotation.get("when", "midnight"),
+                                                backupCount=rotation.get("backup_count", 7), encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(log_file, maxBytes=rotation.get("max_bytes", 10 * 1024 * 1024),
+                                           backupCount=rotation.get("backup_count", 5), encoding='utf-8')
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [file_handler, logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # Le reactor et les workers ne font que déposer les enregistrements dans une file ;
+    # le formatage et les écritures (fichier, console) se font sur le thread du QueueListener
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(ChannelSamplingFilter(bot_settings.get("log_sampling", {})))
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+    apply_log_levels(resolve_log_levels(bot_settings))
+    log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+
+def resolve_log_levels(bot_settings: dict) -> tuple:
+    """Niveaux `(racine, irc.client)` demandés par `log_level` et `irc_log_level` (lève AttributeError sur un type invalide)."""
+    root_level = getattr(logging, bot_settings.get("log_level", "INFO").upper(), logging.INFO)
+    # La bibliothèque IRC journalise chaque ligne brute en DEBUG : elle a son propre niveau
+    irc_level = getattr(logging, bot_settings.get("irc_log_level", "WARNING").upper(), logging.WARNING)
+    return root_level, irc_level
+
+
+def apply_log_levels(levels: tuple):
+    """Applique les niveaux calculés par resolve_log_levels (à l'initialisation et à chaque rechargement)."""
+    root_level, irc_level = levels
+    logging.getLogger().setLevel(root_level)
+    logging.getLogger("irc.client").setLevel(irc_level)
+
+
+# --- Métriques (format Prometheus) ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+
+
+class Metrics:
+    """Registre minimal de compteurs et d'histogrammes, exporté au format texte de Prometheus.
+
+    Les valeurs instantanées (profondeur des files, taille du cache...) sont lues au moment de
+    l'export par des collecteurs, qui retournent des tuples `(nom, type, aide, labels, valeur)`.
+    Thread-safe : alimenté depuis le reactor et les workers.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._descriptions = {} # nom -> (type, aide)
+        self._buckets = {}      # nom de l'histogramme -> bornes
+        self._counters = {}     # (nom, labels) -> valeur
+        self._histograms = {}   # (nom, labels) -> [comptes par borne, somme, nombre]
+        self._collectors = {}   # clé -> callable ; une clé réenregistrée remplace l'ancien collecteur
+
+    def describe(self, name: str, kind: str, help_text: str, buckets=None):
+        self._descriptions[name] = (kind, help_text)
+        if buckets:
+            self._buckets[name] = tuple(buckets)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._buckets.get(name, LATENCY_BUCKETS)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def set_collector(self, key: str, collector):
+        with self._lock:
+            self._collectors[key] = collector
+
+    @staticmethod
+    def _format_labels(labels) -> str:
+        if not labels:
+            return ""
+        escaped = []
+        for name, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{name}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        samples = {} # nom -> liste de lignes
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._histograms.items()]
+            collectors = list(self._collectors.values())
+        for (name, labels), value in counters:
+            samples.setdefault(name, []).append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets.get(name, LATENCY_BUCKETS), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{self._format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{self._format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        for collector in collectors:
+            try:
+                for name, kind, help_text, labels, value in collector():
+                    self._descriptions.setdefault(name, (kind, help_text))
+                    samples.setdefault(name, []).append(f"{name}{self._format_labels(tuple(sorted(labels.items())))} {value}")
+            except Exception as e:
+                logging.warning(f"Erreur d'un collecteur de métriques: {e}")
+        output = []
+        for name in sorted(samples):
+            kind, help_text = self._descriptions.get(name, ("untyped", ""))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(samples[name])
+        return "\n".join(output) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("Métriques: %s " + format, self.address_string(), *args)
+
+
+def start_metrics_server(metrics_config: dict):
+    """Démarre le serveur HTTP des métriques (thread démon) ; retourne None s'il est désactivé."""
+    if not metrics_config.get("enabled", False):
+        return None
+    host, port = metrics_config.get("host", "127.0.0.1"), metrics_config.get("port", 9464)
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Métriques Prometheus disponibles sur http://{host}:{port}/metrics")
+    return server
+
+
+metrics = Metrics() # Registre global, partagé par toutes les instances du bot
+metrics.describe("ollama_queue_wait_seconds", "histogram", "Attente d'une requête Ollama avant son envoi (file des workers)")
+metrics.describe("ollama_request_seconds", "histogram", "Durée totale d'une requête Ollama vue par le bot")
+metrics.describe("ollama_load_seconds", "histogram", "Temps de chargement du modèle (load_duration)")
+metrics.describe("ollama_prompt_eval_seconds", "histogram", "Temps d'évaluation du prompt (prompt_eval_duration)")
+metrics.describe("ollama_generation_seconds", "histogram", "Temps de génération de la réponse (eval_duration)")
+metrics.describe("ollama_generation_tokens_per_second", "histogram", "Vitesse de génération (eval_count / eval_duration)", TOKENS_PER_SECOND_BUCKETS)
+metrics.describe("ollama_prompt_tokens_total", "counter", "Jetons de prompt évalués (prompt_eval_count)")
+metrics.describe("ollama_generated_tokens_total", "counter", "Jetons générés (eval_count)")
+metrics.describe("ollama_requests_total", "counter", "Requêtes Ollama terminées, par résultat")
+metrics.describe("ollama_rejections_total", "counter", "Requêtes refusées avant envoi à Ollama, par raison")
+metrics.describe("irc_send_lag_seconds", "histogram", "Temps passé par une ligne dans la file d'envoi IRC")
+metrics.describe("irc_messages_ingested_total", "counter", "Messages ajoutés à l'historique, par canal et par rôle")
+metrics.describe("irc_reconnects_total", "counter", "Tentatives de reconnexion au serveur IRC")
+metrics.describe("ollama_warmups_total", "counter", "Préchargements du modèle (démarrage, connexion, inactivité), par résultat")
+metrics.describe("ollama_cold_starts_total", "counter", "Requêtes qui ont attendu le chargement du modèle (load_duration >= 1s)")
+metrics.describe("irc_connections_total", "counter", "Connexions réussies au serveur IRC (RPL_WELCOME)")
+
+
+# --- Découpage des messages IRC ---
+IRC_MAX_LINE_BYTES = 450 # Limite typique, un peu moins que 512 pour être sûr avec préfixes, etc.
+
+def _skip_whitespace(data: bytes, start: int) -> int:
+    """Position du premier caractère non blanc de `data` à partir de `start`, comme str.lstrip (espaces Unicode compris)."""
+    length = len(data)
+    while start < length:
+        lead = data[start]
+        size = 1 if lead < 0x80 else 2 if lead < 0xE0 else 3 if lead < 0xF0 else 4
+        if not data[start:start + size].decode('utf-8').isspace():
+            break
+        start += size
+    return start
+
+def split_irc_line(line: str, max_bytes: int = IRC_MAX_LINE_BYTES):
+    """Découpe une ligne en morceaux d'au plus `max_bytes` octets UTF-8.
+
+    Coupe de préférence sur le dernier espace qui tient dans la limite (si le morceau
+    dépasse 75% de la limite), sinon sur une frontière de caractère : une séquence
+    multi-octets n'est jamais coupée. La ligne est encodée une seule fois et parcourue
+    en temps linéaire.
+    """
+    data = line.encode('utf-8')
+    length = len(data)
+    start = 0
+    while length - start > max_bytes:
+        end = start + max_bytes
+        # Reculer jusqu'au début d'un caractère (les octets de continuation sont de la forme 10xxxxxx)
+        while end > start and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        last_space = data.rfind(b' ', start, end)
+        if last_space > start and end - start > max_bytes * 0.75: # Couper à l'espace si c'est raisonnable
+            part, start = data[start:last_space], last_space + 1
+        else: # Coupure brutale si pas d'espace
+            part, start = data[start:end], end
+        start = _skip_whitespace(data, start)
+        yield part.decode('utf-8')
+
+    if start < length:
+        yield data[start:].decode('utf-8')
+
+
+class IrcLineStream:
+    """Assemble les fragments d'une réponse en streaming en lignes IRC complètes.
+
+    Chaque ligne terminée (ou chaque morceau qui atteint la limite d'octets) est
+    passée à `emit` dès qu'elle est prête. `prefix` (ex: "nick: ") est ajouté à la
+    première ligne non vide.
+    """
+    def __init__(self, emit, prefix: str = "", max_bytes: int = IRC_MAX_LINE_BYTES):
+        self._emit = emit
+        self._prefix = prefix
+        self._pending = ""
+        self.max_bytes = max_bytes
+        self.lines_sent = 0
+
+    def feed(self, text: str):
+        self._pending += text
+        while "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            self._emit_line(line)
+
+        # Ligne en cours déjà trop longue : on envoie les morceaux complets sans attendre la fin de ligne
+        head = self._pending.lstrip()
+        if len(head) * 4 > self.max_bytes and len((self._prefix + head).encode('utf-8')) > self.max_bytes:
+            parts = list(split_irc_line(self._prefix + head, self.max_bytes))
+            self._prefix = ""
+            for part in parts[:-1]:
+                self._send(part)
+            self._pending = parts[-1]
+
+    def flush(self):
+        line, self._pending = self._pending, ""
+        self._emit_line(line)
+
+    def discard(self):
+        """Oublie la ligne en cours sans l'envoyer (requête annulée)."""
+        self._pending = ""
+
+    def _emit_line(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+        line, self._prefix = self._prefix + line, ""
+        self._send(line)
+
+    def _send(self, line: str):
+        self.lines_sent += 1
+        self._emit(line)
+
+
+class ReplyBudget:
+    """Lignes IRC qu'une réponse peut encore envoyer ; les suivantes sont mises de côté pour !more."""
+    __slots__ = ("lines_left", "overflow")
+
+    def __init__(self, max_lines: int):
+        self.lines_left = max_lines if max_lines > 0 else None # None = pas de limite
+        self.overflow = []
+
+    def take(self, lines: list) -> list:
+        """Retourne les lignes à envoyer maintenant et garde le reste dans `overflow`."""
+        if self.lines_left is None:
+            return lines
+        visible = lines[:self.lines_left]
+        self.lines_left -= len(visible)
+        self.overflow.extend(lines[len(visible):])
+        return visible
+
+
+class PagedReplies:
+    """Suites de réponses en attente de !more, une par (canal, nick), bornées en lignes, en nombre et en durée."""
+    def __init__(self, max_lines: int = 20, max_users: int = 200, ttl: float = 600):
+        self.max_lines = max_lines
+        self.max_users = max_users
+        self.ttl = ttl
+        self._pages = OrderedDict() # (canal, nick en minuscules) -> (expiration, deque de lignes)
+
+    def store(self, channel: str, nick: str, lines: list):
+        """Remplace la suite en attente de `nick` sur `channel` ; retourne le nombre de lignes gardées."""
+        key = (channel, irc.strings.lower(nick))
+        kept = lines[:self.max_lines]
+        if len(lines) > self.max_lines:
+            kept[-1] = kept[-1] + " [...]" # Réponse tronquée au-delà du tampon
+        self._pages.pop(key, None)
+        if not kept:
+            return 0
+        self._pages[key] = (time.monotonic() + self.ttl, deque(kept))
+        while len(self._pages) > self.max_users:
+            self._pages.popitem(last=False)
+        return len(kept)
+
+    def next_page(self, channel: str, nick: str, count: int):
+        """Retourne les `count` lignes suivantes et le nombre de lignes restantes."""
+        key = (channel, irc.strings.lower(nick))
+        entry = self._pages.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._pages.pop(key, None)
+            return [], 0
+        lines = entry[1]
+        page = [lines.popleft() for _ in range(min(count, len(lines)))]
+        if not lines:
+            del self._pages[key]
+        return page, len(lines)
+
+    def prune(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._pages.items() if expires < now]:
+            del self._pages[key]
+
+
+class OutboundQueue:
+    """File d'envoi IRC non bloquante, vidée par le scheduler du reactor.
+
+    Un seau à jetons (`burst` messages d'avance, puis `rate` messages par seconde)
+    respecte l'anti-flood du serveur ; les cibles sont servies à tour de rôle pour
+    qu'une longue réponse dans un canal ne bloque pas les autres, et les réponses
+    courtes prioritaires (ex: !ping) passent devant. Utilisée uniquement sur le reactor,
+    sauf `depth()` sans cible, qui lit un compteur et peut être appelée depuis un autre thread (métriques).
+    """
+    def __init__(self, send, rate: float, burst: int = 3, max_per_target: int = 20):
+        self._send = send # callable(cible, texte)
+        self.rate = rate
+        self.burst = max(1, int(burst))
+        self.max_per_target = max(1, int(max_per_target))
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._priority = deque()          # (cible, horodatage, texte)
+        self._queues = OrderedDict()      # cible -> deque[(horodatage, texte)], dans l'ordre du tour de rôle
+        self._pending = 0                 # Lignes en attente, toutes files confondues
+        self.dropped = 0
+
+    def enqueue(self, target: str, lines, priority: bool = False) -> int:
+        """Ajoute des lignes pour `target` et retourne le nombre de lignes acceptées."""
+        now = time.monotonic()
+        if priority:
+            self._priority.extend((target, now, line) for line in lines)
+            self._pending += len(lines)
+            return len(lines)
+        target_queue = self._queues.setdefault(target, deque())
+        accepted = max(0, min(len(lines), self.max_per_target - len(target_queue)))
+        target_queue.extend((now, line) for line in lines[:accepted])
+        self._pending += accepted
+        if accepted < len(lines):
+            self.dropped += len(lines) - accepted
+            logging.warning(f"File d'envoi pleine pour {target}: {len(lines) - accepted} ligne(s) abandonnée(s).")
+        if not target_queue:
+            del self._queues[target]
+        return accepted
+
+    def pump(self):
+        """Envoie autant de lignes que le seau à jetons le permet."""
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        while self._tokens >= 1:
+            item = self._next()
+            if item is None:
+                return
+            target, enqueued_at, text = item
+            self._tokens -= 1
+            metrics.observe("irc_send_lag_seconds", now - enqueued_at)
+            self._send(target, text)
+
+    def _next(self):
+        if self._priority:
+            self._pending -= 1
+            return self._priority.popleft()
+        for target, target_queue in self._queues.items():
+            self._pending -= 1
+            enqueued_at, text = target_queue.popleft()
+            # Tour de rôle : la cible servie passe en fin de liste
+            if target_queue:
+                self._queues.move_to_end(target)
+            else:
+                del self._queues[target]
+            return target, enqueued_at, text
+        return None
+
+    def depth(self, target: str = None) -> int:
+        if target is not None:
+            return len(self._queues.get(target, ())) + sum(1 for t, _, _ in self._priority if t == target)
+        return self._pending
+
+    def clear(self) -> int:
+        pending, self._pending = self._pending, 0
+        self._priority.clear()
+        self._queues.clear()
+        return pending
+
+
+# --- Client HTTP Ollama ---
+class RequestCancelled(Exception):
+    """Requête Ollama annulée (demandeur parti, question remplacée, déconnexion) ou hors délai."""
+
+
+class CancelToken:
+    """Jeton d'annulation et échéance d'une requête Ollama.
+
+    Annulé depuis le reactor, vérifié par le worker avant l'envoi et entre deux fragments :
+    l'annulation ferme le flux HTTP, ce qui arrête la génération côté Ollama. Une requête
+    fusionnée (SingleFlight) a plusieurs demandeurs (`holders`) ; `release` ne l'annule que
+    lorsque le dernier s'en désintéresse.
+    """
+    DEADLINE = "délai dépassé"
+
+    def __init__(self, timeout: float = None):
+        self.created_at = time.monotonic()
+        self.deadline = self.created_at + timeout if timeout else None
+        self.reason = None
+        self.holders = 1
+        self.probe = False # Requête de test du disjoncteur semi-ouvert
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def release(self, reason: str):
+        self.holders -= 1
+        if self.holders <= 0:
+            self.cancel(reason)
+
+    def remaining(self):
+        """Secondes restantes avant l'échéance (None si pas d'échéance)."""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self):
+        """Lève `RequestCancelled` si la requête est annulée ou si l'échéance est passée."""
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(self.DEADLINE)
+        if self._event.is_set():
+            raise RequestCancelled(self.reason)
+
+
+class OllamaEndpoint:
+    """Un serveur Ollama, avec son poids, sa charge en cours et son état de santé."""
+    def __init__(self, url: str, weight: float = 1.0):
+        url = url.rstrip("/")
+        # On accepte l'URL de base ("http://hote:11434") ou l'URL complète de l'API (".../api/chat")
+        for api_path in ("/api/chat", "/api/generate"):
+            if url.endswith(api_path):
+                self.base_url, self.api_path = url[:-len(api_path)], api_path
+                break
+        else:
+            self.base_url, self.api_path = url, "/api/chat"
+        self.weight = max(float(weight), 0.01)
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.models = None # Modèles disponibles d'après /api/tags (None = pas encore sondé)
+
+    @property
+    def api_url(self) -> str:
+        return self.base_url + self.api_path
+
+    def has_model(self, model: str) -> bool:
+        if self.models is None or not model:
+            return True
+        return model in self.models or (":" not in model and f"{model}:latest" in self.models)
+
+
+class OllamaClient:
+    """Client HTTP partagé vers Ollama.
+
+    Possède une session `requests` avec un pool de connexions keep-alive, pour ne pas
+    rouvrir une connexion TCP (et éventuellement TLS) à chaque requête. Créé une seule
+    fois dans `main()` et partagé par tous les canaux et toutes les reconnexions.
+
+    Avec plusieurs endpoints, chaque requête part vers le serveur sain qui a le moins de
+    requêtes en cours (pondéré par son poids) et qui dispose du modèle demandé.
+    """
+    def __init__(self, endpoints, pool_size=4, keep_alive=True, connect_timeout=5, read_timeout=90, compression=False,
+                 max_failures=3, health_check_interval=30):
+        self.endpoints = [ep if isinstance(ep, OllamaEndpoint) else OllamaEndpoint(ep) for ep in endpoints]
+        if not self.endpoints:
+            raise ValueError("Aucun endpoint Ollama configuré (ollama.api_url ou ollama.endpoints).")
+        self.api_url = ", ".join(ep.api_url for ep in self.endpoints)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_failures = max(1, int(max_failures))
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._stop_health_checks = threading.Event()
+        self._health_thread = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(len(self.endpoints), 1), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+        # Par défaut, pas de compression : Ollama est le plus souvent local et le streaming reste plus réactif
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" if compression else "identity"
+
+    @classmethod
+    def from_config(cls, ollama_config: dict):
+        endpoints_cfg = ollama_config.get("endpoints") or [{"url": ollama_config.get("api_url")}]
+        endpoints = [OllamaEndpoint(ep["url"], ep.get("weight", 1)) if isinstance(ep, dict) else OllamaEndpoint(ep)
+                     for ep in endpoints_cfg]
+        return cls(
+            endpoints,
+            pool_size=ollama_config.get("connection_pool_size", ollama_config.get("worker_threads", 4)),
+            keep_alive=ollama_config.get("http_keep_alive", True),
+            connect_timeout=ollama_config.get("connect_timeout", 5),
+            read_timeout=ollama_config.get("request_timeout", 90),
+            compression=ollama_config.get("compress_responses", False),
+            max_failures=ollama_config.get("endpoint_max_failures", 3),
+            health_check_interval=ollama_config.get("health_check_interval", 30),
+        )
+
+    def _acquire(self, model: str) -> OllamaEndpoint:
+        with self._lock:
+            healthy = [ep for ep in self.endpoints if ep.healthy]
+            candidates = [ep for ep in healthy if ep.has_model(model)] or healthy or self.endpoints
+            endpoint = min(candidates, key=lambda ep: (ep.outstanding + 1) / ep.weight)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _release(self, endpoint: OllamaEndpoint, success: bool):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if success:
+                endpoint.consecutive_failures = 0
+                return
+            endpoint.consecutive_failures += 1
+            if endpoint.healthy and endpoint.consecutive_failures >= self.max_failures:
+                endpoint.healthy = False
+                logging.warning(f"Endpoint Ollama {endpoint.base_url} marqué hors service après {endpoint.consecutive_failures} échecs.")
+
+    def chat(self, payload: dict, on_chunk=None, cancel_token: CancelToken = None) -> dict:
+        """Envoie `payload` à l'API et retourne la réponse JSON décodée.
+
+        Si `payload["stream"]` est vrai, les fragments de texte sont passés à `on_chunk` au fil
+        de l'eau et la réponse retournée contient le texte complet et les statistiques finales.
+        Avec `cancel_token`, la réponse est toujours lue en flux pour pouvoir s'arrêter entre deux
+        fragments (`RequestCancelled`), et le timeout de lecture ne dépasse pas l'échéance.
+        """
+        timeout = self.timeout
+        if cancel_token is not None:
+            cancel_token.check()
+            payload = dict(payload, stream=True)
+            remaining = cancel_token.remaining()
+            if remaining is not None:
+                timeout = (self.timeout[0], max(0.1, min(self.timeout[1], remaining)))
+        endpoint = self._acquire(payload.get("model"))
+        success = False
+        try:
+            stream = bool(payload.get("stream"))
+            with self.session.post(endpoint.api_url, json=payload, timeout=timeout, stream=stream) as response:
+                # Une erreur 4xx vient de la requête (modèle inconnu...), pas de l'état du serveur
+                success = response.status_code < 500
+                response.raise_for_status()
+                result = self._read_stream(response, on_chunk, cancel_token) if stream else response.json()
+            success = True
+            return result
+        except RequestCancelled:
+            success = True # Annulée de notre côté : le serveur n'y est pour rien
+            raise
+        finally:
+            self._release(endpoint, success)
+
+    def embed(self, model: str, inputs: list) -> list:
+        """Retourne les embeddings de `inputs` (liste de textes) via /api/embed."""
+        endpoint = self._acquire(model)
+        success = False
+        try:
+            response = self.session.post(endpoint.base_url + "/api/embed", json={"model": model, "input": inputs}, timeout=self.timeout)
+            success = response.status_code < 500
+            response.raise_for_status()
+            embeddings = response.json().get("embeddings", [])
+            success = True
+            return embeddings
+        finally:
+            self._release(endpoint, success)
+
+    def preload(self, model: str, keep_alive=None) -> list:
+        """Demande à chaque endpoint sain de charger `model` (requête sans message, rien n'est généré).
+
+        Retourne les `load_duration` (secondes) des endpoints qui ont répondu ; ~0 si le modèle était déjà chargé.
+        """
+        payload = {"model": model, "messages": [], "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        with self._lock:
+            endpoints = [ep for ep in self.endpoints if ep.healthy and ep.has_model(model)] or [ep for ep in self.endpoints if ep.healthy]
+        durations = []
+        for endpoint in endpoints:
+            try:
+                response = self.session.post(endpoint.api_url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                durations.append(response.json().get("load_duration", 0) / 1e9)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logging.warning(f"Préchargement de {model} sur {endpoint.base_url} impossible: {e}")
+        return durations
+
+    @staticmethod
+    def _read_stream(response, on_chunk, cancel_token: CancelToken = None) -> dict:
+        """Lit les chunks NDJSON d'Ollama et retourne le dernier chunk, complété du texte entier."""
+        parts = []
+        last_chunk = {}
+        for raw_line in response.iter_lines():
+            if cancel_token is not None:
+                cancel_token.check() # En sortant, le `with` de chat() ferme la connexion : Ollama arrête de générer
+            if not raw_line:
+                continue
+            chunk = json.loads(raw_line)
+            if chunk.get("error"):
+                raise ValueError(f"Ollama a retourné une erreur en cours de streaming : {chunk['error']}")
+            piece = chunk.get("message", {}).get("content") or chunk.get("response", "")
+            if piece:
+                parts.append(piece)
+                if on_chunk:
+                    on_chunk(piece)
+            last_chunk = chunk
+            if chunk.get("done"):
+                break
+        last_chunk["message"] = {"role": "assistant", "content": "".join(parts)}
+        return last_chunk
+
+    def check_health(self):
+        """Sonde chaque endpoint via /api/tags : état de santé et liste des modèles disponibles."""
+        for endpoint in self.endpoints:
+            try:
+                response = self.session.get(endpoint.base_url + "/api/tags", timeout=self.timeout[0])
+                response.raise_for_status()
+                models = {m.get("name") for m in response.json().get("models", [])}
+            except (requests.exceptions.RequestException, ValueError) as e:
+                with self._lock:
+                    if endpoint.healthy:
+                        logging.warning(f"Endpoint Ollama {endpoint.base_url} injoignable: {e}")
+                    endpoint.healthy = False
+                continue
+            with self._lock:
+                if not endpoint.healthy:
+                    logging.info(f"Endpoint Ollama {endpoint.base_url} de nouveau disponible.")
+                endpoint.healthy = True
+                endpoint.consecutive_failures = 0
+                endpoint.models = models
+
+    def start_health_checks(self):
+        if self._health_thread or not self.health_check_interval or self.health_check_interval <= 0:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop_health_checks.is_set():
+            self.check_health()
+            self._stop_health_checks.wait(self.health_check_interval)
+
+    def close(self):
+        self._stop_health_checks.set()
+        self.session.close()
+
+
+class ModelWarmer:
+    """Garde le modèle principal chargé par Ollama, pour que la première réponse après un silence ne paie pas son chargement.
+
+    Le modèle est préchargé au démarrage et après chaque (re)connexion IRC, puis « pingé » par une
+    requête vide dès qu'il n'a pas servi depuis `idle_interval` secondes : à garder sous le délai
+    `keep_alive` d'Ollama (5 minutes par défaut), au-delà duquel il décharge le modèle.
+    """
+    RECENT = 30 # Secondes pendant lesquelles un modèle qui vient de servir est considéré chargé
+
+    def __init__(self, client, model: str, keep_alive=None, idle_interval: float = 240, on_connect: bool = True):
+        self.client = client
+        self.model = model
+        self.keep_alive = keep_alive
+        self.idle_interval = idle_interval
+        self.on_connect = on_connect
+        self.last_used = 0.0 # time.monotonic() de la dernière requête ou du dernier préchargement
+        self._in_flight = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, ollama_config: dict, client):
+        """Construit le préchargeur depuis la section `warmup` ; retourne None s'il est désactivé."""
+        warmup_config = ollama_config.get("warmup", {})
+        if not warmup_config.get("enabled", True):
+            return None
+        return cls(
+            client,
+            ollama_config.get("model"),
+            keep_alive=ollama_config.get("keep_alive"),
+            idle_interval=warmup_config.get("idle_interval", 240),
+            on_connect=warmup_config.get("on_connect", True),
+        )
+
+    def touch(self):
+        """Signale que le modèle vient de servir (il est donc chargé)."""
+        self.last_used = time.monotonic()
+
+    def request(self, dispatcher, reason: str) -> bool:
+        """Lance un préchargement sur un worker, sauf s'il y en a déjà un en cours ou que le modèle vient de servir."""
+        with self._lock:
+            if self._in_flight or time.monotonic() - self.last_used < self.RECENT:
+                return False
+            self._in_flight = True
+        dispatcher.submit(self.warm, reason)
+        return True
+
+    def ping_if_idle(self, dispatcher):
+        # Appelé périodiquement par le reactor
+        if self.idle_interval and self.idle_interval > 0 and time.monotonic() - self.last_used >= self.idle_interval:
+            self.request(dispatcher, "inactivité")
+
+    def warm(self, reason: str):
+        """Précharge le modèle. Bloquant : à exécuter sur un worker."""
+        try:
+            started = time.monotonic()
+            durations = self.client.preload(self.model, self.keep_alive)
+            if not durations:
+                metrics.inc("ollama_warmups_total", result="error")
+                return
+            self.touch()
+            metrics.inc("ollama_warmups_total", result="ok")
+            load_seconds = max(durations)
+            metrics.observe("ollama_load_seconds", load_seconds)
+            if load_seconds >= 1:
+                logging.info(f"Modèle {self.model} chargé par Ollama ({reason}) en {load_seconds:.1f}s.")
+            else:
+                logging.debug(f"Modèle {self.model} déjà chargé ({reason}), vérifié en {time.monotonic() - started:.2f}s.")
+        finally:
+            with self._lock:
+                self._in_flight = False
+
+
+class CircuitBreaker:
+    """Disjoncteur autour du backend Ollama, pour échouer tout de suite quand il est en panne.
+
+    Fermé : les requêtes passent. Après `failure_threshold` échecs (ou réponses trop lentes) consécutifs,
+    il s'ouvre : les requêtes sont refusées immédiatement pendant `reset_timeout` secondes. Ensuite, il
+    passe en semi-ouvert et laisse passer une seule requête de test : si elle réussit dans le budget de
+    latence, il se referme, sinon il se rouvre. Thread-safe : consulté par le reactor, alimenté par les workers.
+    """
+    CLOSED, OPEN, HALF_OPEN = "fermé", "ouvert", "semi-ouvert"
+
+    def __init__(self, failure_threshold: int = 3, latency_budget: float = 30, reset_timeout: float = 30):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.latency_budget = latency_budget
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.fast_failures = 0
+        self.last_error = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, ollama_config: dict):
+        breaker_config = ollama_config.get("circuit_breaker", {})
+        if not breaker_config.get("enabled", True):
+            return None
+        return cls(
+            failure_threshold=breaker_config.get("failure_threshold", 3),
+            latency_budget=breaker_config.get("latency_budget", 30),
+            reset_timeout=breaker_config.get("reset_timeout", 30),
+        )
+
+    def allow(self) -> bool:
+        """Indique si une requête peut partir ; en semi-ouvert, une seule à la fois (la requête de test)."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                logging.info("Disjoncteur Ollama semi-ouvert : envoi d'une requête de test.")
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.fast_failures += 1
+            return False
+
+    def release_probe(self):
+        """Rend la place de la requête de test si elle n'a finalement pas été envoyée."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, success: bool, latency: float, error: str = None, probe: bool = False):
+        """Enregistre le résultat d'une requête (`latency` en secondes).
+
+        En semi-ouvert, seule la requête de test (`probe`) décide de la suite : le résultat d'une
+        requête plus ancienne, admise avant l'ouverture, est ignoré.
+        """
+        slow = self.latency_budget and latency > self.latency_budget
+        with self._lock:
+            if probe:
+                self._probe_in_flight = False
+            elif self.state == self.HALF_OPEN:
+                return
+            if success and not slow:
+                if self.state != self.CLOSED:
+                    logging.info(f"Disjoncteur Ollama refermé (requête réussie en {latency:.1f}s).")
+                self.state = self.CLOSED
+                self.consecutive_failures = 0
+                return
+            self.consecutive_failures += 1
+            self.last_error = error or f"réponse trop lente ({latency:.1f}s)"
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                logging.warning(f"Disjoncteur Ollama ouvert après {self.consecutive_failures} échec(s) consécutif(s) "
+                                f"({self.last_error}) : réponses immédiates pendant {self.reset_timeout}s.")
+
+    def status(self) -> str:
+        with self._lock:
+            text = f"disjoncteur {self.state}, {self.consecutive_failures} échec(s) consécutif(s)"
+            if self.state == self.OPEN:
+                text += f", nouvel essai dans {max(0, self.reset_timeout - (time.monotonic() - self.opened_at)):.0f}s"
+            if self.last_error:
+                text += f", dernière erreur : {self.last_error}"
+            return text + f", ouvert {self.times_opened} fois, {self.fast_failures} requête(s) refusée(s)"
+
+
+# --- Cache des réponses Ollama ---
+class ResponseCache:
+    """Cache en mémoire des réponses Ollama, borné en taille, avec éviction LRU + TTL.
+
+    La clé combine le modèle, le prompt système résolu, le prompt utilisateur normalisé
+    et, si `include_context` est actif, une empreinte de l'historique envoyé.
+    Thread-safe : lu depuis le reactor et alimenté depuis les workers.
+    """
+    def __init__(self, max_entries=500, ttl=600, include_context=False, disabled_channels=None, persist_file=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.include_context = include_context
+        self.disabled_channels = {ch.lower() for ch in (disabled_channels or [])}
+        self.persist_file = persist_file
+        self._entries = OrderedDict() # clé -> (expiration, réponse), du moins au plus récemment utilisé
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, cache_config: dict):
+        if not cache_config.get("enabled", True):
+            return None
+        cache = cls(
+            max_entries=cache_config.get("max_entries", 500),
+            ttl=cache_config.get("ttl", 600),
+            include_context=cache_config.get("include_context", False),
+            disabled_channels=cache_config.get("disabled_channels", []),
+            persist_file=cache_config.get("persist_file"),
+        )
+        cache.load()
+        return cache
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        return " ".join(prompt.casefold().split())
+
+    @classmethod
+    def make_key(cls, model: str, system_prompt: str, prompt: str, context=None) -> str:
+        key_material = [model, system_prompt, cls.normalize_prompt(prompt), context]
+        return hashlib.sha256(json.dumps(key_material, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def enabled_for(self, channel: str) -> bool:
+        return channel.lower() not in self.disabled_channels
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def load(self):
+        if not self.persist_file or not os.path.exists(self.persist_file):
+            return
+        try:
+            with open(self.persist_file, 'r', encoding='utf-8') as f:
+                saved_entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Impossible de relire le cache de réponses '{self.persist_file}': {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, expires_at, response in saved_entries[-self.max_entries:]:
+                if expires_at > now:
+                    self._entries[key] = (expires_at, response)
+        logging.info(f"Cache de réponses: {len(self._entries)} entrées rechargées depuis '{self.persist_file}'.")
+
+    def save(self):
+        if not self.persist_file:
+            return
+        with self._lock:
+            now = time.time()
+            saved_entries = [[key, expires_at, response] for key, (expires_at, response) in self._entries.items() if expires_at > now]
+        try:
+            with open(self.persist_file, 'w', encoding='utf-8') as f:
+                json.dump(saved_entries, f, ensure_ascii=False)
+        except OSError as e:
+            logging.warning(f"Impossible de sauvegarder le cache de réponses '{self.persist_file}': {e}")
+
+
+# --- Historique des conversations ---
+MESSAGE_TOKEN_OVERHEAD = 4 # Jetons ajoutés par le gabarit de chat autour de chaque message
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière du nombre de jetons (~4 octets UTF-8 par jeton), sans tokenizer."""
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+class HistoryEntry:
+    """Un message de l'historique. `__slots__` et nicks internés pour limiter la mémoire.
+
+    `tokens` est l'estimation du coût du message dans le prompt, calculée une fois à l'ajout.
+    """
+    __slots__ = ("role", "name", "content", "timestamp", "tokens")
+
+    def __init__(self, role: str, name: str, content: str, timestamp: float):
+        self.role = sys.intern(role)
+        self.name = sys.intern(name)
+        self.content = content
+        self.timestamp = timestamp
+        self.tokens = estimate_tokens(name) + estimate_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+
+
+class ChannelHistory:
+    """Tampon circulaire des derniers messages d'un canal : ajout et élimination en O(1)."""
+    __slots__ = ("entries", "last_activity", "anchor", "summary", "loaded")
+
+    def __init__(self, capacity: int, loaded: bool = True):
+        self.entries = deque(maxlen=capacity)
+        self.last_activity = time.time()
+        self.anchor = None # Premier message de la fenêtre stable (voir stable_window)
+        self.summary = ""  # Résumé des messages plus anciens, repliés par le HistorySummarizer
+        self.loaded = loaded # False tant que les messages sauvegardés (HistoryStore) n'ont pas été relus
+
+    def __len__(self):
+        return len(self.entries)
+
+    def recent(self, count: int) -> list:
+        if count <= 0:
+            return []
+        return list(itertools.islice(self.entries, max(0, len(self.entries) - count), None))
+
+    def window(self, token_budget: int, max_messages: int) -> list:
+        """Messages les plus récents tenant dans `token_budget` (remplissage du plus récent au plus ancien).
+
+        Le message le plus récent est toujours inclus, même s'il dépasse à lui seul le budget.
+        """
+        selected = []
+        used_tokens = 0
+        for entry in reversed(self.entries):
+            if len(selected) >= max_messages or (selected and used_tokens + entry.tokens > token_budget):
+                break
+            selected.append(entry)
+            used_tokens += entry.tokens
+        selected.reverse()
+        return selected
+
+    def stable_window(self, token_budget: int, max_messages: int) -> list:
+        """Fenêtre dont le début reste fixe tant qu'elle tient dans le budget : seuls les nouveaux tours s'ajoutent.
+
+        Le préfixe du prompt (système + anciens messages) est ainsi identique d'une requête à l'autre,
+        ce qui permet à Ollama de réutiliser son cache KV. Quand la fenêtre déborde, on la ré-ancre sur
+        une fenêtre à moitié pleine, pour pouvoir ajouter plusieurs tours avant le prochain décalage.
+        """
+        entries = list(self.entries)
+        start = next((i for i, entry in enumerate(entries) if entry is self.anchor), None)
+        selected = entries[start:] if start is not None else []
+        if not selected or len(selected) > max_messages or sum(entry.tokens for entry in selected) > token_budget:
+            selected = self.window(token_budget // 2, max(1, max_messages // 2)) if max_messages > 0 else []
+        self.anchor = selected[0] if selected else None
+        return selected
+
+    def fold(self, folded: list, summary: str):
+        """Remplace les messages `folded` (les plus anciens) par `summary`.
+
+        Seuls les messages encore en tête du tampon sont retirés : ceux éliminés entre-temps
+        par le tampon circulaire sont simplement ignorés.
+        """
+        folded_ids = {id(entry) for entry in folded}
+        while self.entries and id(self.entries[0]) in folded_ids:
+            self.entries.popleft()
+        self.summary = summary
+
+    def memory_usage(self) -> int:
+        """Estimation (en octets) de la mémoire occupée par ce canal ; les nicks internés ne sont pas comptés."""
+        return sys.getsizeof(self.summary) + sys.getsizeof(self.entries) + sum(sys.getsizeof(entry) + sys.getsizeof(entry.content) for entry in self.entries)
+
+
+class HistoryStore:
+    """Stockage durable de l'historique dans SQLite (mode WAL), pour le retrouver après un redémarrage.
+
+    Les messages sont mis en attente en mémoire et écrits par lots par un thread dédié toutes les
+    `flush_interval` secondes. Le même thread applique périodiquement la rétention (âge maximum et
+    nombre maximum de messages par canal). La lecture se fait canal par canal, à la demande.
+    """
+    def __init__(self, path: str, flush_interval: float = 2, retention_days: float = 30, max_messages_per_channel: int = 1000,
+                 prune_interval: float = 3600):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.max_messages_per_channel = max_messages_per_channel
+        self.prune_interval = prune_interval
+        self._pending = [] # (canal, rôle, nick, contenu, horodatage) pas encore écrits
+        self._pending_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL") # Suffisant en WAL : on peut perdre le dernier lot, pas corrompre la base
+        self._db.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, channel TEXT NOT NULL, role TEXT NOT NULL, "
+                         "name TEXT NOT NULL, content TEXT NOT NULL, timestamp REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id)")
+        self._db.commit()
+        self._thread = threading.Thread(target=self._run, name="history-store", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, store_config: dict):
+        """Ouvre la base décrite par `bot_settings.history_store` ; retourne None si elle est désactivée."""
+        if not store_config.get("enabled", False):
+            return None
+        return cls(
+            store_config.get("path", "history.db"),
+            flush_interval=store_config.get("flush_interval", 2),
+            retention_days=store_config.get("retention_days", 30),
+            max_messages_per_channel=store_config.get("max_messages_per_channel", 1000),
+        )
+
+    def append(self, channel: str, entry: HistoryEntry):
+        with self._pending_lock:
+            self._pending.append((channel, entry.role, entry.name, entry.content, entry.timestamp))
+
+    def load(self, channel: str, limit: int) -> list:
+        """Retourne les `limit` derniers messages du canal (du plus ancien au plus récent)."""
+        self.flush() # Le canal a pu être oublié puis repris avant l'écriture de ses derniers messages
+        with self._db_lock:
+            rows = self._db.execute("SELECT role, name, content, timestamp FROM messages WHERE channel = ? ORDER BY id DESC LIMIT ?",
+                                    (channel, limit)).fetchall()
+        rows.reverse()
+        return [HistoryEntry(role, name, content, timestamp) for role, name, content, timestamp in rows]
+
+    def flush(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        with self._db_lock:
+            with self._db: # Une seule transaction par lot
+                self._db.executemany("INSERT INTO messages (channel, role, name, content, timestamp) VALUES (?, ?, ?, ?, ?)", batch)
+
+    def prune(self) -> int:
+        """Applique la rétention ; retourne le nombre de messages supprimés."""
+        deleted = 0
+        with self._db_lock:
+            with self._db:
+                if self.retention_days:
+                    deleted += self._db.execute("DELETE FROM messages WHERE timestamp < ?",
+                                                (time.time() - self.retention_days * 86400,)).rowcount
+                if self.max_messages_per_channel:
+                    channels = [row[0] for row in self._db.execute("SELECT DISTINCT channel FROM messages")]
+                    for channel in channels:
+                        deleted += self._db.execute(
+                            "DELETE FROM messages WHERE channel = ? AND id <= (SELECT id FROM messages WHERE channel = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                            (channel, channel, self.max_messages_per_channel)).rowcount
+        return deleted
+
+    def _run(self):
+        next_prune = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + self.prune_interval
+                    deleted = self.prune()
+                    if deleted:
+                        logging.info(f"Historique persistant : {deleted} ancien(s) message(s) supprimé(s) (rétention).")
+            except sqlite3.Error as e:
+                logging.error(f"Erreur d'écriture de l'historique dans {self.path}: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            logging.error(f"Erreur d'écriture de l'historique dans {self.path}: {e}")
+        with self._db_lock:
+            self._db.close()
+
+
+class ConversationHistory:
+    """Historique de tous les canaux, borné en nombre de messages par canal et en nombre de canaux.
+
+    Les canaux sont gardés dans l'ordre de leur dernière activité : au-delà de `max_channels`,
+    le canal inactif depuis le plus longtemps est oublié. Protégé par un verrou car lu depuis
+    les workers Ollama.
+
+    Avec un `HistoryStore`, chaque message est aussi sauvegardé, et l'historique d'un canal
+    est relu depuis la base au premier accès (et non au démarrage).
+    """
+    def __init__(self, capacity: int = 14, max_channels: int = 1000):
+        self.capacity = max(1, int(capacity))
+        self.max_channels = max(1, int(max_channels))
+        self.store = None
+        self._channels = OrderedDict() # canal -> ChannelHistory, du moins au plus récemment actif
+        self._lock = threading.Lock()
+
+    def configure(self, capacity: int, max_channels: int, store: HistoryStore = None):
+        with self._lock:
+            self.capacity = max(1, int(capacity))
+            self.max_channels = max(1, int(max_channels))
+            self.store = store
+            for name, channel_history in self._channels.items():
+                if channel_history.entries.maxlen != self.capacity:
+                    resized = ChannelHistory(self.capacity)
+                    resized.entries.extend(channel_history.entries)
+                    resized.last_activity = channel_history.last_activity
+                    resized.anchor = channel_history.anchor
+                    resized.summary = channel_history.summary
+                    resized.loaded = channel_history.loaded
+                    self._channels[name] = resized
+            self._evict_overflow()
+
+    def __contains__(self, channel: str) -> bool:
+        return channel in self._channels
+
+    def __len__(self):
+        return len(self._channels)
+
+    def ensure_channel(self, channel: str):
+        with self._lock:
+            self._touch(channel)
+
+    def add(self, channel: str, role: str, name: str, content: str, timestamp: float = None):
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self._lock:
+            channel_history = self._touch(channel)
+            self._load(channel, channel_history)
+            entry = HistoryEntry(role, name, content, timestamp)
+            channel_history.entries.append(entry)
+            channel_history.last_activity = timestamp
+            if self.store:
+                self.store.append(channel, entry)
+
+    def recent(self, channel: str, count: int) -> list:
+        with self._lock:
+            channel_history = self._get(channel)
+            return channel_history.recent(count) if channel_history else []
+
+    def window(self, channel: str, token_budget: int, max_messages: int) -> list:
+        with self._lock:
+            channel_history = self._get(channel)
+            return channel_history.window(token_budget, max_messages) if channel_history else []
+
+    def stable_window(self, channel: str, token_budget: int, max_messages: int) -> list:
+        with self._lock:
+            channel_history = self._get(channel)
+            return channel_history.stable_window(token_budget, max_messages) if channel_history else []
+
+    def summary(self, channel: str) -> str:
+        with self._lock:
+            channel_history = self._get(channel)
+            return channel_history.summary if channel_history else ""
+
+    def oldest(self, channel: str, keep: int) -> list:
+        """Messages du canal plus anciens que les `keep` derniers."""
+        with self._lock:
+            channel_history = self._get(channel)
+            if channel_history is None:
+                return []
+            return list(itertools.islice(channel_history.entries, 0, max(0, len(channel_history.entries) - keep)))
+
+    def fold(self, channel: str, folded: list, summary: str):
+        with self._lock:
+            channel_history = self._get(channel)
+            if channel_history is not None:
+                channel_history.fold(folded, summary)
+
+    def evict_idle(self, max_idle: float) -> int:
+        """Oublie les canaux sans activité depuis `max_idle` secondes ; retourne le nombre de canaux oubliés."""
+        limit = time.time() - max_idle
+        with self._lock:
+            idle = [name for name, channel_history in self._channels.items() if channel_history.last_activity < limit]
+            for name in idle:
+                del self._channels[name]
+        return len(idle)
+
+    def memory_report(self) -> dict:
+        """Mémoire estimée (octets) par canal."""
+        with self._lock:
+            return {name: channel_history.memory_usage() for name, channel_history in self._channels.items()}
+
+    def _get(self, channel: str):
+        channel_history = self._channels.get(channel)
+        if channel_history is not None:
+            self._load(channel, channel_history)
+        return channel_history
+
+    def _load(self, channel: str, channel_history: ChannelHistory):
+        if channel_history.loaded:
+            return
+        channel_history.loaded = True
+        try:
+            saved = self.store.load(channel, self.capacity)
+        except sqlite3.Error as e:
+            logging.error(f"Impossible de relire l'historique de {channel}: {e}")
+            return
+        # Les messages arrivés avant la relecture restent les plus récents
+        room = self.capacity - len(channel_history.entries)
+        if saved and room > 0:
+            channel_history.entries.extendleft(reversed(saved[-room:]))
+        if saved:
+            logging.debug(f"Historique de {channel}: {len(saved)} message(s) relu(s) depuis la base.")
+
+    def _touch(self, channel: str) -> ChannelHistory:
+        channel_history = self._channels.get(channel)
+        if channel_history is None:
+            channel_history = self._channels[channel] = ChannelHistory(self.capacity, loaded=self.store is None)
+            self._evict_overflow()
+        else:
+            self._channels.move_to_end(channel)
+        return channel_history
+
+    def _evict_overflow(self):
+        while len(self._channels) > self.max_channels:
+            name, _ = self._channels.popitem(last=False)
+            logging.debug(f"Historique du canal {name} oublié (limite de {self.max_channels} canaux suivis atteinte).")
+
+
+class HistorySummarizer:
+    """Replie les plus anciens messages d'un canal dans un résumé, à l'aide d'un petit modèle.
+
+    Quand un canal atteint `trigger_messages` messages, tout sauf les `keep_messages` derniers
+    est résumé (avec le résumé précédent) en arrière-plan, hors du chemin des réponses.
+    Le résumé est ensuite ajouté à la partie système des prompts de ce canal.
+    """
+    DEFAULT_PROMPT = ("Tu résumes des conversations IRC. Fusionne le résumé existant et les nouveaux messages "
+                      "en un seul résumé concis (quelques phrases), qui garde les sujets abordés, les faits, "
+                      "les décisions et qui a dit quoi. Réponds uniquement par le résumé.")
+
+    def __init__(self, client, model: str, trigger_messages: int, keep_messages: int, max_tokens: int = 200, prompt: str = None):
+        self.client = client
+        self.model = model
+        self.trigger_messages = max(2, int(trigger_messages))
+        self.keep_messages = min(max(1, int(keep_messages)), self.trigger_messages - 1)
+        self.max_tokens = max_tokens
+        self.prompt = prompt or self.DEFAULT_PROMPT
+        self.pending = set() # Canaux dont le résumé est en cours de calcul
+
+    @classmethod
+    def from_config(cls, ollama_config: dict, client, capacity: int):
+        """Construit le résumeur depuis la section `summary` ; retourne None s'il est désactivé."""
+        summary_config = ollama_config.get("summary", {})
+        if not summary_config.get("enabled", False):
+            return None
+        # Par défaut on résume un peu avant que le tampon circulaire ne commence à perdre des messages
+        trigger_messages = min(summary_config.get("trigger_messages", capacity - max(2, capacity // 4)), capacity)
+        return cls(
+            client,
+            summary_config.get("model", ollama_config.get("model")),
+            trigger_messages,
+            summary_config.get("keep_messages", ollama_config.get("context_messages_count", 5)),
+            summary_config.get("max_tokens", 200),
+            summary_config.get("prompt"),
+        )
+
+    def candidates(self, channel: str) -> list:
+        """Messages à replier si le canal a atteint le seuil et qu'aucun résumé n'est en cours, sinon []."""
+        if channel in self.pending:
+            return []
+        folded = conversation_history.oldest(channel, self.keep_messages)
+        if len(folded) + self.keep_messages < self.trigger_messages:
+            return []
+        return folded
+
+    def summarize(self, channel: str, previous_summary: str, folded: list) -> str:
+        """Appelle le modèle et retourne le nouveau résumé. Bloquant : à exécuter sur un worker."""
+        transcript = "\n".join(f"{entry.name}: {entry.content}" for entry in folded)
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.prompt},
+                {"role": "user", "content": f"Résumé existant de {channel} :\n{previous_summary or '(aucun)'}\n\nNouveaux messages :\n{transcript}"},
+            ],
+            "stream": False,
+            "options": {"temperature": 0.2, "num_predict": self.max_tokens},
+        }
+        api_response = self.client.chat(payload)
+        return api_response.get("message", {}).get("content", "").strip()
+
+
+conversation_history = ConversationHistory() # Historique par canal, partagé par toutes les instances du bot (survit aux reconnexions)
+
+
+# --- Mémoire à long terme (embeddings) ---
+class ChannelVectorIndex:
+    """Vecteurs normalisés des messages d'un canal, dans une matrice NumPy de taille fixe.
+
+    La matrice est un tampon circulaire : au-delà de `capacity` messages, les plus anciens sont
+    écrasés. Avec `path`, elle est projetée en mémoire (`np.memmap`) et les messages sont ajoutés
+    à un fichier JSONL à côté (`n` = numéro d'ajout, la case est `n % capacity`), ce qui permet
+    de la recharger au redémarrage.
+    """
+    def __init__(self, dim: int, capacity: int, path: str = None, count: int = 0, messages: list = None):
+        self.dim = dim
+        self.capacity = capacity
+        self.path = path
+        self.count = count # Nombre total de messages ajoutés depuis la création
+        self.messages = messages if messages is not None else [None] * capacity # case -> (nick, contenu, horodatage)
+        self._meta_file = None
+        if path:
+            mode = "r+" if count and os.path.exists(path + ".f32") else "w+"
+            self.vectors = np.memmap(path + ".f32", dtype=np.float32, mode=mode, shape=(capacity, dim))
+            if mode == "w+":
+                with open(path + ".jsonl", "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"dim": dim, "capacity": capacity}) + "\n")
+            self._meta_file = open(path + ".jsonl", "a", encoding="utf-8")
+        else:
+            self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str, capacity: int):
+        """Recharge un index depuis le disque ; retourne None s'il n'existe pas ou n'a pas la même capacité."""
+        try:
+            with open(path + ".jsonl", "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                records = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return None
+        if header.get("capacity") != capacity or not os.path.exists(path + ".f32"):
+            return None
+        messages = [None] * capacity
+        for record in records:
+            messages[record["n"] % capacity] = (record["name"], record["content"], record["timestamp"])
+        count = records[-1]["n"] + 1 if records else 0
+        if len(records) > 2 * capacity:
+            # Le JSONL ne fait que grandir : on ne garde que les messages encore présents dans la matrice
+            with open(path + ".jsonl", "w", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n")
+                for record in records[-capacity:]:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return cls(header["dim"], capacity, path, count, messages)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def add(self, vectors, messages: list):
+        for vector, message in zip(vectors, messages):
+            slot = self.count % self.capacity
+            self.vectors[slot] = vector
+            self.messages[slot] = message
+            if self._meta_file:
+                name, content, timestamp = message
+                self._meta_file.write(json.dumps({"n": self.count, "name": name, "content": content, "timestamp": timestamp}, ensure_ascii=False) + "\n")
+            self.count += 1
+
+    def search(self, query, top_k: int, min_score: float, exclude=frozenset()) -> list:
+        """Retourne jusqu'à `top_k` messages `(score, (nick, contenu, horodatage))` les plus proches de `query`."""
+        size = len(self)
+        if size == 0 or top_k <= 0:
+            return []
+        scores = self.vectors[:size] @ query # Vecteurs normalisés : produit scalaire = similarité cosinus
+        candidates = min(size, top_k + len(exclude))
+        best = np.argpartition(-scores, candidates - 1)[:candidates]
+        results = []
+        for slot in best[np.argsort(-scores[best])]:
+            score = float(scores[slot])
+            if score < min_score or len(results) >= top_k:
+                break
+            message = self.messages[slot]
+            if message and (message[0], message[1]) not in exclude:
+                results.append((score, message))
+        return results
+
+    def flush(self):
+        if self._meta_file:
+            self.vectors.flush()
+            self._meta_file.flush()
+
+    def close(self):
+        self.flush()
+        if self._meta_file:
+            self._meta_file.close()
+            self._meta_file = None
+
+
+class EmbeddingMemory:
+    """Mémoire à long terme : retrouve les anciens messages d'un canal proches de la question posée.
+
+    Les messages passés à `add` (thread du reactor) sont mis en attente puis vectorisés par lots
+    via l'API d'embeddings d'Ollama, sur un worker du dispatcher : l'ingestion ne bloque jamais
+    le reactor. `recall` (sur un worker) vectorise la question et cherche les plus proches voisins.
+    """
+    def __init__(self, client, dispatcher, model: str, memory_dir: str = None, capacity: int = 5000, top_k: int = 3,
+                 min_score: float = 0.5, batch_size: int = 16, min_chars: int = 12):
+        self.client = client
+        self.dispatcher = dispatcher
+        self.model = model
+        self.memory_dir = memory_dir
+        self.capacity = max(1, int(capacity))
+        self.top_k = top_k
+        self.min_score = min_score
+        self.batch_size = max(1, int(batch_size))
+        self.min_chars = min_chars
+        self._pending = []     # (canal, nick, contenu, horodatage) en attente d'embedding (thread du reactor)
+        self._ingesting = False
+        self._indexes = {}     # canal -> ChannelVectorIndex
+        self._lock = threading.Lock()
+        if memory_dir:
+            os.makedirs(memory_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, ollama_config: dict, client, dispatcher):
+        """Construit la mémoire depuis la section `long_term_memory` ; retourne None si elle est désactivée."""
+        memory_config = ollama_config.get("long_term_memory", {})
+        if not memory_config.get("enabled", False):
+            return None
+        if np is None:
+            logging.warning("Mémoire à long terme désactivée : le module numpy n'est pas installé (pip install numpy).")
+            return None
+        return cls(
+            client,
+            dispatcher,
+            memory_config.get("model", "nomic-embed-text"),
+            memory_dir=memory_config.get("memory_dir", "memory"),
+            capacity=memory_config.get("max_messages_per_channel", 5000),
+            top_k=memory_config.get("top_k", 3),
+            min_score=memory_config.get("min_score", 0.5),
+            batch_size=memory_config.get("batch_size", 16),
+            min_chars=memory_config.get("min_chars", 12),
+        )
+
+    def add(self, channel: str, name: str, content: str, timestamp: float):
+        """Met un message en attente d'embedding. À appeler depuis le thread du reactor."""
+        if len(content) < self.min_chars:
+            return
+        self._pending.append((channel, name, content, timestamp))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Envoie les messages en attente à un worker. Appelé par le reactor (lot plein ou périodiquement)."""
+        if self._ingesting or not self._pending:
+            return
+        batch, self._pending = self._pending[:self.batch_size * 4], self._pending[self.batch_size * 4:]
+        self._ingesting = True
+        future = self.dispatcher.submit(self._ingest, batch)
+        future.add_done_callback(lambda done: self.dispatcher.call_soon(self._ingest_done, batch, done))
+
+    def _ingest_done(self, batch: list, future):
+        self._ingesting = False
+        try:
+            future.result()
+        except Exception as e:
+            logging.warning(f"Mémoire à long terme : échec de l'embedding de {len(batch)} message(s) : {e}")
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def _ingest(self, batch: list):
+        vectors = self._embed([content for _, _, content, _ in batch])
+        by_channel = {}
+        for (channel, name, content, timestamp), vector in zip(batch, vectors):
+            by_channel.setdefault(channel, ([], []))
+            by_channel[channel][0].append(vector)
+            by_channel[channel][1].append((name, content, timestamp))
+        with self._lock:
+            for channel, (channel_vectors, messages) in by_channel.items():
+                self._index(channel, vectors.shape[1], create=True).add(channel_vectors, messages)
+
+    def _embed(self, texts: list):
+        vectors = np.asarray(self.client.embed(self.model, texts), dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError(f"Réponse d'embeddings inattendue (forme {vectors.shape} pour {len(texts)} texte(s))")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _index_path(self, channel: str):
+        if not self.memory_dir:
+            return None
+        safe_name = re.sub(r"[^\w.-]", "_", channel)
+        return os.path.join(self.memory_dir, f"{safe_name}-{hashlib.sha1(channel.encode('utf-8')).hexdigest()[:8]}")
+
+    def _index(self, channel: str, dim: int = None, create: bool = False):
+        """Index du canal (chargé depuis le disque au premier accès). Appelé avec le verrou pris."""
+        index = self._indexes.get(channel)
+        path = self._index_path(channel)
+        if index is None and path:
+            index = self._indexes[channel] = ChannelVectorIndex.load(path, self.capacity)
+        if create and (index is None or index.dim != dim):
+            if index is not None:
+                logging.warning(f"Mémoire à long terme de {channel} réinitialisée (dimension {index.dim} -> {dim}, modèle changé ?).")
+                index.close()
+            index = self._indexes[channel] = ChannelVectorIndex(dim, self.capacity, path)
+        return index
+
+    def recall(self, channel: str, query: str, exclude=frozenset()) -> list:
+        """Anciens messages `(nick, contenu, horodatage)` les plus proches de `query`. Bloquant : à appeler sur un worker."""
+        with self._lock:
+            index = self._index(channel)
+            if index is None or len(index) == 0:
+                return []
+        try:
+            query_vector = self._embed([query])[0]
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.warning(f"Mémoire à long terme : échec de l'embedding de la question sur {channel} : {e}")
+            return []
+        with self._lock:
+            if index.dim != len(query_vector):
+                return []
+            results = index.search(query_vector, self.top_k, self.min_score, exclude)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Mémoire à long terme [%s] : %d message(s) retrouvé(s), scores %s", channel, len(results), [round(score, 3) for score, _ in results])
+        return [message for _, message in results]
+
+    def close(self):
+        """Vectorise ce qui reste en attente puis écrit les index sur le disque."""
+        if self._pending:
+            try:
+                self._ingest(self._pending)
+            except Exception as e:
+                logging.warning(f"Mémoire à long terme : {len(self._pending)} message(s) non enregistré(s) à l'arrêt : {e}")
+            self._pending = []
+        with self._lock:
+            for index in self._indexes.values():
+                if index is not None:
+                    index.close()
+
+
+# --- Filtres de sécurité ---
+class SecurityFilter:
+    """Filtres anti-spam et nicks bloqués, précompilés à partir de la section `security`.
+
+    Les nicks bloqués sont stockés dans un ensemble normalisé selon la casse IRC
+    (`irc.strings.lower`), et tous les mots-clés de spam sont regroupés dans une
+    seule expression régulière. L'objet est immuable : pour changer la configuration,
+    on en construit un nouveau et on remplace la référence en une seule affectation.
+    """
+    def __init__(self, blocked_nicks=(), spam_keywords=()):
+        self.blocked_nicks = frozenset(irc.strings.lower(nick) for nick in blocked_nicks if nick)
+        # Mot-clé en minuscules -> mot-clé tel qu'écrit dans la configuration (pour les logs)
+        self._keywords = {keyword.lower(): keyword for keyword in spam_keywords if keyword}
+        # Les plus longs d'abord, pour signaler le mot-clé le plus précis
+        alternatives = sorted(self._keywords, key=len, reverse=True)
+        self._spam_pattern = re.compile("|".join(map(re.escape, alternatives))) if alternatives else None
+
+    @classmethod
+    def from_config(cls, security_config: dict):
+        return cls(security_config.get("blocked_nicks", []), security_config.get("spam_filter_keywords", []))
+
+    def is_blocked(self, nick: str) -> bool:
+        return irc.strings.lower(nick) in self.blocked_nicks
+
+    def find_spam_keyword(self, message_text: str):
+        """Retourne le mot-clé de spam trouvé dans le message, ou None."""
+        if self._spam_pattern is None:
+            return None
+        match = self._spam_pattern.search(message_text.lower())
+        return self._keywords[match.group(0)] if match else None
+
+
+# --- Dispatch asynchrone des requêtes Ollama ---
+class OllamaDispatcher:
+    """Pool de workers pour les appels Ollama, hors du thread du reactor IRC.
+
+    Les workers ne touchent jamais directement à la connexion IRC : ils déposent
+    des callables dans une file thread-safe, que le reactor vide via `drain()`.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max(1, int(max_workers))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ollama-worker")
+        self._ready = queue.SimpleQueue()
+        self.pending = 0 # Tâches soumises et pas encore terminées (en attente ou en cours)
+        self._pending_lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Exécute `func` sur un worker et retourne le Future correspondant."""
+        with self._pending_lock:
+            self.pending += 1
+        future = self._executor.submit(func, *args, **kwargs)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._pending_lock:
+            self.pending -= 1
+
+    def ready_count(self) -> int:
+        """Résultats en attente de traitement par le reactor."""
+        return self._ready.qsize()
+
+    def call_soon(self, func, *args):
+        """Demande l'exécution de `func(*args)` sur le thread du reactor (appelable depuis n'importe quel thread)."""
+        self._ready.put((func, args))
+
+    def drain(self):
+        """Exécute les callables en attente. À appeler uniquement depuis le thread du reactor."""
+        while True:
+            try:
+                func, args = self._ready.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception as e:
+                logging.error(f"Erreur lors du traitement d'un résultat Ollama sur le reactor: {e}", exc_info=True)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Champs de statistiques renvoyés par Ollama avec la réponse (durées en nanosecondes)
+OLLAMA_STAT_FIELDS = ("total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration")
+
+
+class OllamaReply:
+    """Résultat d'une requête Ollama, tel que remis au reactor."""
+    __slots__ = ("text", "ok", "streamed", "stats")
+
+    def __init__(self, text: str, ok: bool = True, streamed: bool = False, stats: dict = None):
+        self.text = text
+        self.ok = ok
+        self.streamed = streamed
+        self.stats = stats or {}
+
+
+class SingleFlight:
+    """Fusionne les requêtes identiques en cours : les suivantes attendent le Future de la première.
+
+    `attach` et `lead` sont appelés depuis le reactor ; l'oubli de la requête terminée
+    se fait depuis le worker, d'où le verrou.
+    """
+    def __init__(self):
+        self._inflight = {} # clé -> Future de la requête en cours
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def attach(self, key: str):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            return future
+
+    def lead(self, key: str, future):
+        with self._lock:
+            self._inflight[key] = future
+        future.add_done_callback(partial(self._forget, key))
+
+    def _forget(self, key: str, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+class ReplySequencer:
+    """Garantit que les réponses d'un même canal partent dans l'ordre des demandes.
+
+    Chaque demande reçoit un ticket (numéro de séquence par canal). Les événements
+    d'un ticket qui n'est pas encore en tête sont mis de côté jusqu'à ce que les
+    tickets précédents soient terminés. Utilisé uniquement sur le thread du reactor.
+    """
+    def __init__(self):
+        self._next_ticket = {} # canal -> prochain ticket à distribuer
+        self._current = {}     # canal -> ticket en cours de livraison
+        self._held = {}        # canal -> {ticket: [(action, final), ...]}
+
+    def ticket(self, channel: str) -> int:
+        seq = self._next_ticket.get(channel, 0)
+        self._next_ticket[channel] = seq + 1
+        return seq
+
+    def push(self, channel: str, seq: int, action=None, final: bool = False):
+        """Livre `action` si `seq` est en tête pour ce canal, sinon la met en attente.
+        `final` indique que le ticket est terminé et libère le suivant."""
+        if seq != self._current.get(channel, 0):
+            self._held.setdefault(channel, {}).setdefault(seq, []).append((action, final))
+            return
+        if action:
+            action()
+        if final:
+            self._advance(channel)
+
+    def discard(self, channel: str, seq: int):
+        """Termine le ticket `seq` en abandonnant ce qu'il avait mis en attente."""
+        if seq != self._current.get(channel, 0):
+            self._held.setdefault(channel, {})[seq] = [(None, True)]
+            return
+        self._advance(channel)
+
+    def _advance(self, channel: str):
+        held = self._held.get(channel, {})
+        seq = self._current.get(channel, 0) + 1
+        while True:
+            self._current[channel] = seq
+            finished = False
+            for action, final in held.pop(seq, []):
+                if action:
+                    action()
+                if final:
+                    finished = True
+                    break
+            if not finished:
+                break
+            seq += 1
+        if not held:
+            self._held.pop(channel, None)
+
+
+class AdmissionController:
+    """Contrôle d'admission devant le modèle : file globale bornée et quotas par canal et par nick.
+
+    `admit` refuse tout de suite une requête (et retourne la raison) si la file est pleine, si le
+    canal ou le nick a trop de requêtes en cours ou a dépassé son débit, ou si l'attente estimée
+    (d'après la durée moyenne des générations) dépasse `max_wait`. Utilisé uniquement depuis le
+    thread du reactor, donc sans verrou.
+    """
+    REASONS = ("queue_full", "channel_busy", "nick_busy", "deadline", "nick_rate", "channel_rate")
+
+    def __init__(self, workers: int = 4, max_pending: int = 32, max_per_channel: int = 4, max_per_nick: int = 2,
+                 channel_rate: float = 20, nick_rate: float = 6, max_wait: float = 60, busy_reply_interval: float = 10):
+        self.workers = max(1, int(workers))
+        self.max_pending = max_pending
+        self.max_per_channel = max_per_channel
+        self.max_per_nick = max_per_nick
+        self.channel_rate = channel_rate # Requêtes par minute (0 = pas de limite)
+        self.nick_rate = nick_rate
+        self.max_wait = max_wait
+        self.busy_reply_interval = busy_reply_interval
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejections = dict.fromkeys(self.REASONS, 0)
+        self.avg_latency = None # Durée moyenne (glissante) d'une génération, en secondes
+        self._per_channel = {}
+        self._per_nick = {}
+        self._channel_buckets = {} # canal -> [jetons, dernier remplissage]
+        self._nick_buckets = {}
+        self._last_busy_reply = {} # canal -> instant du dernier message "occupé"
+
+    @classmethod
+    def from_config(cls, ollama_config: dict):
+        admission_config = ollama_config.get("admission", {})
+        if not admission_config.get("enabled", True):
+            return None
+        return cls(
+            workers=ollama_config.get("worker_threads", 4),
+            max_pending=admission_config.get("max_pending", 32),
+            max_per_channel=admission_config.get("max_per_channel", 4),
+            max_per_nick=admission_config.get("max_per_nick", 2),
+            channel_rate=admission_config.get("channel_rate_per_minute", 20),
+            nick_rate=admission_config.get("nick_rate_per_minute", 6),
+            max_wait=admission_config.get("max_wait", 60),
+            busy_reply_interval=admission_config.get("busy_reply_interval", 10),
+        )
+
+    def estimated_wait(self) -> float:
+        """Attente estimée (secondes) avant qu'une nouvelle requête ne commence à être générée."""
+        if self.avg_latency is None or self.in_flight < self.workers:
+            return 0.0
+        waves = (self.in_flight - self.workers) // self.workers + 1
+        return waves * self.avg_latency
+
+    def admit(self, channel: str, nick: str):
+        """Réserve une place pour la requête ; retourne None si elle est admise, sinon la raison du refus."""
+        nick = irc.strings.lower(nick)
+        now = time.monotonic()
+        if self.max_per_nick and self._per_nick.get(nick, 0) >= self.max_per_nick:
+            reason = "nick_busy"
+        elif self.max_per_channel and self._per_channel.get(channel, 0) >= self.max_per_channel:
+            reason = "channel_busy"
+        elif self.max_pending and self.in_flight >= self.max_pending:
+            reason = "queue_full"
+        elif self.max_wait and self.estimated_wait() > self.max_wait:
+            reason = "deadline"
+        elif not self._has_token(self._nick_buckets, nick, self.nick_rate, now):
+            reason = "nick_rate"
+        elif not self._has_token(self._channel_buckets, channel, self.channel_rate, now):
+            reason = "channel_rate"
+        else:
+            self._take_token(self._nick_buckets, nick, self.nick_rate)
+            self._take_token(self._channel_buckets, channel, self.channel_rate)
+            self.in_flight += 1
+            self._per_channel[channel] = self._per_channel.get(channel, 0) + 1
+            self._per_nick[nick] = self._per_nick.get(nick, 0) + 1
+            self.admitted += 1
+            return None
+        self.rejections[reason] += 1
+        return reason
+
+    def release(self, channel: str, nick: str, duration: float):
+        """Libère la place réservée par `admit` une fois la génération terminée."""
+        nick = irc.strings.lower(nick)
+        self.in_flight = max(0, self.in_flight - 1)
+        for counts, key in ((self._per_channel, channel), (self._per_nick, nick)):
+            remaining = counts.get(key, 0) - 1
+            if remaining > 0:
+                counts[key] = remaining
+            else:
+                counts.pop(key, None)
+        self.avg_latency = duration if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * duration
+
+    def should_reply_busy(self, channel: str) -> bool:
+        """Limite les messages "occupé" à un par canal toutes les `busy_reply_interval` secondes."""
+        now = time.monotonic()
+        if now - self._last_busy_reply.get(channel, float("-inf")) < self.busy_reply_interval:
+            return False
+        self._last_busy_reply[channel] = now
+        return True
+
+    def prune(self):
+        """Oublie les compteurs de débit revenus au maximum (nicks et canaux inactifs)."""
+        now = time.monotonic()
+        for buckets, rate in ((self._nick_buckets, self.nick_rate), (self._channel_buckets, self.channel_rate)):
+            for key in [key for key in buckets if self._refill(buckets[key], rate, now) >= max(rate, 1)]:
+                del buckets[key]
+        limit = now - self.busy_reply_interval
+        for channel in [channel for channel, last in self._last_busy_reply.items() if last < limit]:
+            del self._last_busy_reply[channel]
+
+    @staticmethod
+    def _refill(bucket: list, rate: float, now: float) -> float:
+        bucket[0] = min(max(rate, 1), bucket[0] + (now - bucket[1]) * rate / 60.0) # Réserve maximale : une minute de débit
+        bucket[1] = now
+        return bucket[0]
+
+    def _has_token(self, buckets: dict, key: str, rate: float, now: float) -> bool:
+        if not rate:
+            return True
+        bucket = buckets.setdefault(key, [max(rate, 1), now])
+        return self._refill(bucket, rate, now) >= 1
+
+    @staticmethod
+    def _take_token(buckets: dict, key: str, rate: float):
+        if rate:
+            buckets[key][0] -= 1
+
+
+# --- Connexion IRC (CAP/SASL, JOIN groupés, reconnexion) ---
+class SaslServerConnection(ServerConnection):
+    """ServerConnection qui s'authentifie en SASL (PLAIN ou EXTERNAL) pendant l'enregistrement.
+
+    `CAP REQ :sasl` part avant NICK/USER : le serveur suspend l'enregistrement jusqu'au `CAP END`,
+    envoyé une fois l'authentification terminée (réussie ou non). Le 001 arrive donc compte déjà
+    identifié et les canaux peuvent être rejoints tout de suite. Les réponses sont traitées par des
+    handlers propres à la connexion : sur un reactor partagé, un handler global verrait celles des autres.
+    """
+    sasl = None # (mécanisme, compte, mot de passe), défini par le bot ; None pour un enregistrement classique
+
+    def connect(self, *args, **kwargs):
+        self.sasl_authenticated = False
+        self._cap_request_pending = self.sasl is not None
+        super().connect(*args, **kwargs)
+        if self.sasl is not None:
+            # super().connect() vient de réinitialiser les handlers de la connexion
+            for event_type, handler in (("cap", self._on_cap), ("authenticate", self._on_authenticate), ("saslsuccess", self._on_sasl_result),
+                                        ("saslfail", self._on_sasl_result), ("sasltoolong", self._on_sasl_result),
+                                        ("saslaborted", self._on_sasl_result), ("saslalready", self._on_sasl_result)):
+                self.handlers.setdefault(event_type, []).append(handler)
+        return self
+
+    def nick(self, newnick):
+        if self._cap_request_pending:
+            # Premier NICK de connect() : la négociation doit commencer avant lui
+            self._cap_request_pending = False
+            self.cap("REQ", "sasl")
+        super().nick(newnick)
+
+    def _on_cap(self, connection, event):
+        subcommand = event.arguments[0] if event.arguments else ""
+        capabilities = event.arguments[1].split() if len(event.arguments) > 1 else []
+        if subcommand == "ACK" and "sasl" in capabilities:
+            self.send_items("AUTHENTICATE", self.sasl[0])
+        elif subcommand == "NAK":
+            logging.warning(f"SASL refusé par {self.server} ; enregistrement sans authentification.")
+            self.cap("END")
+
+    def _on_authenticate(self, connection, event):
+        if event.target != "+":
+            return
+        mechanism, account, password = self.sasl
+        if mechanism == "EXTERNAL":
+            self.send_items("AUTHENTICATE", "+") # L'identité vient du certificat client
+            return
+        token = base64.b64encode(f"{account}\0{account}\0{password}".encode('utf-8')).decode('ascii')
+        # Les données sont envoyées par blocs de 400 octets ; un bloc plein est suivi de "+"
+        for start in range(0, len(token), 400):
+            self.send_items("AUTHENTICATE", token[start:start + 400])
+        if len(token) % 400 == 0:
+            self.send_items("AUTHENTICATE", "+")
+
+    def _on_sasl_result(self, connection, event):
+        if event.type in ("saslsuccess", "saslalready"):
+            self.sasl_authenticated = True
+            logging.info(f"Authentification SASL ({self.sasl[0]}) réussie sur {self.server}.")
+        else:
+            logging.error(f"Échec de l'authentification SASL sur {self.server} ({event.type}: {' '.join(event.arguments)}).")
+        self.cap("END")
+
+
+class IRCReactor(irc.client.Reactor):
+    """Reactor dont la boucle s'arrête quand toutes ses connexions ont renoncé à se reconnecter."""
+    connection_class = SaslServerConnection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._abandoned = set()
+        self.stopped = False
+
+    def abandon(self, connection):
+        """`connection` ne sera plus reconnectée ; arrête la boucle si c'était la dernière."""
+        self._abandoned.add(connection)
+        with self.mutex:
+            self.stopped = all(conn in self._abandoned for conn in self.connections)
+
+    def process_forever(self, timeout=0.2):
+        while not self.stopped:
+            self.process_once(timeout)
+
+
+def join_batches(channels: list, max_targets: int = None, max_bytes: int = IRC_MAX_LINE_BYTES) -> list:
+    """Regroupe les canaux en listes séparées par des virgules, pour le moins de lignes JOIN possible.
+
+    `max_targets` vient de TARGMAX (ISUPPORT) quand le serveur l'annonce.
+    """
+    batches, current = [], []
+    for channel in channels:
+        candidate = ",".join(current + [channel])
+        if current and (len(candidate.encode('utf-8')) > max_bytes or (max_targets and len(current) >= max_targets)):
+            batches.append(",".join(current))
+            current = []
+        current.append(channel)
+    if current:
+        batches.append(",".join(current))
+    return batches
+
+
+class FastReconnect(irc.bot.ReconnectStrategy):
+    """Reconnexion immédiate au premier essai, puis backoff exponentiel avec jitter.
+
+    Le même bot (historique, files, requêtes suivies) est réutilisé ; on_welcome appelle `reset()`
+    pour que la prochaine coupure soit de nouveau suivie d'un essai immédiat. Après `max_attempts`
+    essais consécutifs ratés (0 = sans limite), le bot renonce et le signale à son reactor.
+    """
+    def __init__(self, min_interval: float = 15, max_interval: float = 300, max_attempts: int = 0):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.max_attempts = max_attempts
+        self.attempts = 0
+        self.bot = None
+        self._check_scheduled = False
+
+    def run(self, bot):
+        self.bot = bot
+        if self._check_scheduled:
+            return
+        if self.max_attempts > 0 and self.attempts >= self.max_attempts:
+            logging.critical(f"Nombre maximum de tentatives de reconnexion ({self.max_attempts}) atteint pour {bot.connection.server}. Abandon.")
+            bot.reactor.abandon(bot.connection)
+            return
+        delay = 0 if self.attempts == 0 else min(self.min_interval * 2 ** (self.attempts - 1), self.max_interval)
+        delay += random.uniform(0, delay * 0.1) # Jitter, pour ne pas revenir tous en même temps
+        self.attempts += 1
+        logging.debug(f"Essai de reconnexion {self.attempts} planifié dans {delay:.0f}s.")
+        bot.reactor.scheduler.execute_after(delay, self.check)
+        self._check_scheduled = True
+
+    def check(self):
+        self._check_scheduled = False
+        if not self.bot.connection.is_connected():
+            metrics.inc("irc_reconnects_total", **self.bot.metric_labels)
+            logging.info(f"Tentative de reconnexion à {self.bot.connection.server} (essai {self.attempts}).")
+            self.bot.jump_server() # En cas d'échec, l'événement disconnect replanifie un essai via run()
+
+    def reset(self):
+        self.attempts = 0
+
+
+def collect_shared_metrics(dispatcher, admission, circuit_breaker, response_cache):
+    """Valeurs instantanées des ressources partagées par tous les bots du processus."""
+    yield "ollama_worker_tasks", "gauge", "Tâches soumises aux workers, en attente ou en cours", {}, dispatcher.pending
+    yield "reactor_pending_callbacks", "gauge", "Résultats des workers en attente de traitement par le reactor", {}, dispatcher.ready_count()
+    yield "history_channels", "gauge", "Canaux dont l'historique est en mémoire", {}, len(conversation_history)
+    if admission:
+        yield "ollama_in_flight", "gauge", "Générations admises et pas encore terminées", {}, admission.in_flight
+        yield "ollama_estimated_wait_seconds", "gauge", "Attente estimée pour une nouvelle requête", {}, admission.estimated_wait()
+    if circuit_breaker:
+        state = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}[circuit_breaker.state]
+        yield "ollama_circuit_state", "gauge", "État du disjoncteur (0 fermé, 1 semi-ouvert, 2 ouvert)", {}, state
+    if response_cache:
+        cache_stats = response_cache.stats()
+        yield "ollama_response_cache_entries", "gauge", "Réponses en cache", {}, cache_stats["entries"]
+        for field in ("hits", "misses", "evictions"):
+            yield f"ollama_response_cache_{field}_total", "counter", f"Cache des réponses : {field}", {}, cache_stats[field]
+        yield "ollama_response_cache_hit_ratio", "gauge", "Proportion de réponses servies depuis le cache", {}, cache_stats["hit_rate"]
+
+
+def schedule_shared_tasks(reactor, dispatcher, long_term_memory, ollama_config: dict, model_warmer=None):
+    """Planifie sur le reactor les tâches des ressources partagées (une seule fois par reactor)."""
+    # Le reactor récupère régulièrement les réponses produites par les workers
+    reactor.scheduler.execute_every(0.1, dispatcher.drain)
+    if long_term_memory:
+        # Les messages en attente sont vectorisés par lots pleins, ou au plus tard à cet intervalle
+        reactor.scheduler.execute_every(ollama_config.get("long_term_memory", {}).get("flush_interval", 5), long_term_memory.flush)
+    if model_warmer:
+        # Le préchargement lui-même part sur un worker ; ici on ne fait que vérifier l'inactivité
+        reactor.scheduler.execute_every(30, partial(model_warmer.ping_if_idle, dispatcher))
 
 
 class OllamaIRCBot(irc.bot.SingleServerIRCBot):
-    def __init__(self, channels, nickname, server, port, use_ssl=False, realname=None, server_password=None, nickserv_password=None):
+    reactor_class = IRCReactor # Connexions capables de SASL
+    def __init__(self, channels, nickname, server, port, use_ssl=False, realname=None, server_password=None, nickserv_password=None, dispatcher=None, ollama_client=None, response_cache=None, long_term_memory=None,
+                 network=None, security_config=None, command_prefix=None, reactor=None, admission=None, circuit_breaker=None, admins=None, sasl_config=None,
+                 model_warmer=None):
         irc_config = config.get("irc", {})
         self.ollama_config = config.get("ollama", {})
         self.bot_settings = config.get("bot_settings", {})
-        self.security_config = config.get("security", {})
+        self.security_config = security_config if security_config is not None else config.get("security", {})
+        self.security_filter = SecurityFilter.from_config(self.security_config)
 
+        # Nom du réseau quand plusieurs bots partagent le processus : il préfixe les clés d'historique
+        self.network = network
+        self.metric_labels = {"network": network} if network else {}
         self.target_channels = channels
         self.nickserv_password = nickserv_password
-        self.command_prefix = irc_config.get("command_prefix", "!")
+        self.command_prefix = command_prefix if command_prefix else irc_config.get("command_prefix", "!")
+        # Masques nick!user@host autorisés à utiliser les commandes d'administration (ex: !reload)
+        self.admins = admins if admins is not None else irc_config.get("admins", [])
+        # Fourni par main() pour recharger tous les bots du processus ; à défaut, ce bot seul
+        self.reload_config = None
         
         self.ollama_api_url = self.ollama_config.get("api_url")
-        self.ollama_model = self.ollama_config.get("model")
-        self.ollama_default_system_prompt = self.ollama_config.get("default_system_prompt")
-        self.ollama_channel_tones = self.ollama_config.get("channel_tones", {})
-        self.ollama_context_messages_count = self.ollama_config.get("context_messages_count", 5)
-        self.ollama_request_timeout = self.ollama_config.get("request_timeout", 90)
-
-        self.message_rate_limit_delay = self.bot_settings.get("message_rate_limit_delay", 1.5)
+        self._load_settings(self.ollama_config, self.bot_settings)
+        self.paged_replies = PagedReplies(max_lines=self.bot_settings.get("more_buffer_lines", 20))
         self.last_message_time = 0
+        self.outbound = OutboundQueue(
+            self._privmsg_now,
+            rate=1.0 / self.message_rate_limit_delay if self.message_rate_limit_delay > 0 else 100.0,
+            burst=self.bot_settings.get("send_burst", 3),
+            max_per_target=self.bot_settings.get("send_queue_max_per_target", 20),
+        )
+
+        # Les appels Ollama tournent sur un pool de workers partagé ; le reactor ne fait qu'envoyer/recevoir
+        self.dispatcher = dispatcher if dispatcher else OllamaDispatcher(self.ollama_config.get("worker_threads", 4))
+        self.reply_sequencer = ReplySequencer()
+        self.single_flight = SingleFlight() if self.ollama_config.get("coalesce_requests", True) else None
+        # Admission et disjoncteur protègent le backend : partagés entre réseaux quand ils sont fournis
+        self.admission = admission if admission else AdmissionController.from_config(self.ollama_config)
+        self.circuit_breaker = circuit_breaker if circuit_breaker else CircuitBreaker.from_config(self.ollama_config)
+        self._active_requests = {} # (canal, nick en minuscules) -> CancelToken de la requête en cours
+        self.ollama_client = ollama_client if ollama_client else OllamaClient.from_config(self.ollama_config)
+        self.ollama_api_url = self.ollama_client.api_url
+        self.response_cache = response_cache if response_cache else ResponseCache.from_config(self.ollama_config.get("response_cache", {}))
+        self.summarizer = HistorySummarizer.from_config(self.ollama_config, self.ollama_client, conversation_history.capacity)
+        self.long_term_memory = long_term_memory if long_term_memory else EmbeddingMemory.from_config(self.ollama_config, self.ollama_client, self.dispatcher)
+        self.model_warmer = model_warmer if model_warmer else ModelWarmer.from_config(self.ollama_config, self.ollama_client)
+        # Un collecteur par connexion, plus un pour les ressources partagées (réenregistré à l'identique par chaque bot)
+        metrics.set_collector(f"bot:{network}" if network else "bot", self._collect_metrics) # Remplace le collecteur de l'instance précédente
+        metrics.set_collector("shared", partial(collect_shared_metrics, self.dispatcher, self.admission, self.circuit_breaker, self.response_cache))
+
+        # SASL pendant l'enregistrement (PLAIN : compte/mot de passe, EXTERNAL : certificat client)
+        sasl_config = sasl_config if sasl_config is not None else irc_config.get("sasl", {})
+        sasl_mechanism = (sasl_config.get("mechanism") or "").upper() or None
 
         connect_factory_args = {}
         if use_ssl:
@@ -81,6 +2200,8 @@ class OllamaIRCBot(irc.bot.SingleServerIRCBot):
             # avec un certificat non valide ou auto-signé.
             ssl_context.check_hostname = False
             ssl_context.verify_mode = ssl.CERT_NONE
+            if sasl_config.get("client_cert"):
+                ssl_context.load_cert_chain(sasl_config["client_cert"], sasl_config.get("client_key"))
 
             # === MODIFICATION IMPORTANTE ICI ===
             # Nous devons fournir server_hostname à wrap_socket.
@@ -95,30 +2216,171 @@ class OllamaIRCBot(irc.bot.SingleServerIRCBot):
             )
         # Note: l'argument servername est utilisé par SingleServerIRCBot pour le SNI si connect_factory n'est pas utilisé
         # ou si la factory elle-même ne gère pas le SNI (ce que nous faisons maintenant avec partial).
-        super().__init__([(server, port, server_password)], nickname, realname if realname else nickname, **connect_factory_args)
-        logging.info(f"Bot initialisé pour {server}:{port} avec le pseudo {nickname}, SSL: {use_ssl}")
+        if reactor is not None:
+            self.reactor_class = lambda: reactor # Lu par SimpleIRCClient.__init__ : la connexion est créée sur le reactor commun
+        # Premier essai de reconnexion immédiat, en gardant ce bot et son état
+        recon = FastReconnect(self.bot_settings.get("reconnect_min_delay", 15), self.bot_settings.get("reconnect_max_delay", 300),
+                              self.bot_settings.get("reconnect_attempts", 10))
+        super().__init__([(server, port, server_password)], nickname, realname if realname else nickname, recon=recon, **connect_factory_args)
+        if sasl_mechanism and isinstance(self.connection, SaslServerConnection):
+            self.connection.sasl = (sasl_mechanism, sasl_config.get("username") or nickname, sasl_config.get("password") or nickserv_password)
+        if reactor is not None:
+            # Sur un reactor partagé, les handlers globaux voient les événements de toutes les connexions :
+            # ceux de SingleServerIRCBot (suivi des canaux, reconnexion) ne doivent traiter que les nôtres
+            for event_type in ("disconnect", "join", "kick", "mode", "namreply", "nick", "part", "quit"):
+                handler = getattr(self, "_on_" + event_type)
+                self.reactor.remove_global_handler(event_type, handler)
+                self.reactor.add_global_handler(event_type, self._own_events(handler), -20)
+        else:
+            # Reactor propre au bot : c'est à lui de planifier les tâches des ressources partagées
+            schedule_shared_tasks(self.reactor, self.dispatcher, self.long_term_memory, self.ollama_config, self.model_warmer)
+        # Le reactor vide la file d'envoi au rythme autorisé par l'anti-flood
+        self.reactor.scheduler.execute_every(0.1, self.outbound.pump)
+        self.reactor.scheduler.execute_every(300, self._maintain_history)
+        logging.info(f"Bot initialisé pour {server}:{port} avec le pseudo {nickname}, SSL: {use_ssl}" + (f", réseau {network}" if network else ""))
+
+    def _load_settings(self, ollama_config: dict, bot_settings: dict):
+        """Applique les réglages modifiables à chaud : appelé à l'initialisation puis à chaque rechargement."""
+        vars(self).update(self._read_settings(ollama_config, bot_settings))
+
+    @staticmethod
+    def _read_settings(ollama_config: dict, bot_settings: dict) -> dict:
+        """Calcule les réglages modifiables à chaud sans rien modifier (lève AttributeError/TypeError sur un type invalide)."""
+        model = ollama_config.get("model")
+        request_timeout = ollama_config.get("request_timeout", 90)
+        # Réglages propres à chaque modèle : budget de jetons pour l'historique et num_ctx
+        model_settings = ollama_config.get("model_settings", {}).get(model, {})
+        return {
+            "ollama_config": ollama_config,
+            "bot_settings": bot_settings,
+            "ollama_model": model,
+            "ollama_default_system_prompt": ollama_config.get("default_system_prompt"),
+            "ollama_channel_tones": ollama_config.get("channel_tones", {}),
+            "ollama_context_messages_count": ollama_config.get("context_messages_count", 5),
+            "ollama_request_timeout": request_timeout,
+            "ollama_model_settings": model_settings,
+            "ollama_context_token_budget": model_settings.get("context_token_budget", ollama_config.get("context_token_budget", 1024)),
+            "ollama_num_ctx": model_settings.get("num_ctx", ollama_config.get("num_ctx")),
+            "ollama_prompt_layout": ollama_config.get("prompt_layout", "legacy"),
+            # Limite de génération ; par défaut, de quoi remplir le budget de lignes et le tampon !more
+            "ollama_num_predict": model_settings.get("num_predict", ollama_config.get("num_predict")),
+            "history_idle_ttl": bot_settings.get("history_idle_ttl", 86400),
+            "ollama_stream": ollama_config.get("stream_responses", False),
+            # Durée pendant laquelle Ollama garde le modèle chargé après une requête (ex: "30m", -1 pour toujours)
+            "ollama_keep_alive": ollama_config.get("keep_alive"),
+            "message_rate_limit_delay": bot_settings.get("message_rate_limit_delay", 1.5),
+            # Budget de sortie : lignes IRC par réponse (par canal), le reste est lisible avec !more
+            "max_reply_lines": bot_settings.get("max_reply_lines", 4),
+            "channel_max_reply_lines": bot_settings.get("channel_max_reply_lines", {}),
+            # Échéance de chaque requête, attente dans la file comprise ; au-delà elle est annulée
+            "request_deadline": ollama_config.get("request_deadline", request_timeout),
+            "cancel_on_new_prompt": ollama_config.get("cancel_on_new_prompt", True),
+            "ollama_unavailable_reply": ollama_config.get("circuit_breaker", {}).get(
+                "unavailable_reply", "Mon cerveau (Ollama) est indisponible pour le moment, réessayez dans quelques minutes."),
+        }
+
+    def prepare_reload(self, new_config: dict, network_config: dict):
+        """Prépare l'application d'une nouvelle configuration sans rien modifier ; retourne la fonction qui l'applique.
+
+        Tout ce qui peut échouer (réglages, filtres de sécurité...) est calculé ici et peut lever une exception ;
+        la fonction retournée, appelée sur le thread du reactor, ne fait que remplacer les références
+        et retourne la liste des changements.
+        """
+        security_config = network_config.get("security", new_config.get("security", {}))
+        security_filter = SecurityFilter.from_config(security_config)
+        settings = self._read_settings(new_config.get("ollama", {}), new_config.get("bot_settings", {}))
+        delay = settings["message_rate_limit_delay"]
+        outbound_rate = 1.0 / delay if delay > 0 else 100.0
+        command_prefix = network_config.get("command_prefix", "!")
+        admins = list(network_config.get("admins", []))
+        channels = list(network_config.get("channels", []))
+        current = {irc.strings.lower(channel) for channel in self.target_channels}
+        wanted = {irc.strings.lower(channel) for channel in channels}
+        added = [channel for channel in channels if irc.strings.lower(channel) not in current]
+        removed = [channel for channel in self.target_channels if irc.strings.lower(channel) not in wanted]
+
+        def commit() -> list:
+            changes = []
+            model_changed = settings["ollama_model"] != self.ollama_model
+            if model_changed:
+                changes.append(f"modèle {self.ollama_model} -> {settings['ollama_model']}")
+            if security_config != self.security_config:
+                changes.append("filtres de sécurité")
+            vars(self).update(settings)
+            if self.model_warmer:
+                self.model_warmer.model, self.model_warmer.keep_alive = self.ollama_model, self.ollama_keep_alive
+                if model_changed:
+                    self.model_warmer.last_used = 0.0 # Le nouveau modèle n'a encore jamais servi
+                    self.model_warmer.request(self.dispatcher, "changement de modèle")
+            self.update_security_config(security_config, security_filter)
+            self.command_prefix, self.admins = command_prefix, admins
+            self.outbound.rate = outbound_rate
+            self.target_channels = channels
+            # Déconnecté, on_welcome rejoindra de toute façon la nouvelle liste
+            if self.connection.is_connected():
+                for channel in added:
+                    logging.info(f"Rechargement : tentative de rejoindre le canal {channel}")
+                    conversation_history.ensure_channel(self._scope(channel))
+                for batch in join_batches(added, getattr(self.connection.features, "targmax", {}).get("JOIN")):
+                    self.connection.join(batch)
+                for channel in removed:
+                    logging.info(f"Rechargement : départ du canal {channel}")
+                    self._cancel_requests("canal retiré de la configuration", channel=channel, force=True)
+                    self.connection.part(channel, "Canal retiré de la configuration")
+            if added:
+                changes.append("+" + ",".join(added))
+            if removed:
+                changes.append("-" + ",".join(removed))
+            return changes
+        return commit
+
+    def _is_admin(self, source) -> bool:
+        if not source:
+            return False
+        mask = irc.strings.lower(str(source))
+        return any(fnmatch.fnmatchcase(mask, irc.strings.lower(pattern)) for pattern in self.admins)
+
+    def _dispatcher(self, connection, event):
+        # Un bot ne traite que les événements de sa propre connexion (le reactor peut en porter plusieurs)
+        if connection is self.connection:
+            super()._dispatcher(connection, event)
+
+    def _own_events(self, handler):
+        def filtered(connection, event):
+            if connection is self.connection:
+                return handler(connection, event)
+        return filtered
+
+    def _scope(self, channel: str) -> str:
+        """Clé d'un canal (ou d'un nick) dans l'état partagé (historique, mémoire, quotas) : préfixée par le réseau s'il y en a un."""
+        return f"{self.network}/{channel}" if self.network else channel
         
     def on_welcome(self, c: ServerConnection, e: Event):
         logging.info(f"Connecté au serveur: {e.source.host if isinstance(e.source, NickMask) else e.source}")
-        if self.nickserv_password:
+        metrics.inc("irc_connections_total", **self.metric_labels)
+        self.recon.reset()
+        if self.model_warmer and self.model_warmer.on_connect:
+            # Pendant que l'on rejoint les canaux, Ollama recharge le modèle s'il l'avait déchargé
+            self.model_warmer.request(self.dispatcher, "connexion IRC")
+        if self.nickserv_password and not getattr(c, "sasl_authenticated", False):
+            # Sans SASL, l'identification part juste avant les JOIN, sans attendre la réponse de NickServ
+            # (configurez `sasl` pour les canaux réservés aux comptes identifiés)
             logging.info(f"Identification auprès de NickServ pour {c.get_nickname()}...")
             c.privmsg("NickServ", f"IDENTIFY {self.nickserv_password}")
-            # Il est préférable d'attendre une confirmation de NickServ ou un délai raisonnable
-            # Pour ce code, on va supposer que ça marche et joindre les canaux après un court délai
-            time.sleep(5) 
 
+        logging.info(f"Tentative de rejoindre les canaux: {', '.join(self.target_channels)}")
         for channel in self.target_channels:
-            logging.info(f"Tentative de rejoindre le canal: {channel}")
-            c.join(channel)
-            if channel not in conversation_history:
-                conversation_history[channel] = []
+            conversation_history.ensure_channel(self._scope(channel))
+        max_targets = getattr(c.features, "targmax", {}).get("JOIN") # Connu seulement si le serveur a déjà envoyé son ISUPPORT
+        for batch in join_batches(self.target_channels, max_targets):
+            c.join(batch)
 
     def on_nicknameinuse(self, c: ServerConnection, e: Event):
         original_nick = c.get_nickname()
         new_nick = original_nick + "_"
         logging.warning(f"Pseudo '{original_nick}' déjà utilisé. Tentative avec '{new_nick}'")
         c.nick(new_nick)
-        if self.nickserv_password and original_nick == config.get("irc", {}).get("nickname"): # Si c'est notre pseudo principal
+        if self.nickserv_password and original_nick == self._nickname: # Si c'est notre pseudo principal
             logging.info(f"Le pseudo principal {original_nick} était pris. Si vous utilisez NickServ, "
                          f"vous devrez peut-être récupérer votre pseudo manuellement ou configurer GHOST.")
 
@@ -130,6 +2392,10 @@ class OllamaIRCBot(irc.bot.SingleServerIRCBot):
         reason = e.arguments[1] if len(e.arguments) > 1 else "aucune raison spécifiée"
         
         logging.warning(f"{kicked_nick} a été kické de {channel} par {kicker} pour : {reason}")
+        if kicked_nick == c.get_nickname():
+            self._cancel_requests("kické du canal", channel=channel, force=True)
+        else:
+            self._cancel_requests("kické du canal", channel=channel, nick=kicked_nick)
         
         if kicked_nick == c.get_nickname() and channel in self.target_channels:
             logging.info(f"J'ai été kické de {channel}. Je tenterai de rejoindre après un délai.")
@@ -143,107 +2409,148 @@ class OllamaIRCBot(irc.bot.SingleServerIRCBot):
         logging.error(f"Déconnecté du serveur: {e.source if e.source else 'Serveur inconnu'} - Raison: {e.arguments[0] if e.arguments else 'Inconnue'}")
         # Ceci va faire que la boucle `bot.start()` dans `main()` se termine, permettant à la logique de reconnexion de s'activer.
         # Pas besoin de `raise ConnectionAbortedError` explicitement, la fin de `start()` suffit.
+        dropped = self.outbound.clear()
+        if dropped:
+            logging.warning(f"{dropped} ligne(s) en attente d'envoi abandonnée(s) suite à la déconnexion.")
+        # Plus personne ne lira les réponses : on libère Ollama
+        self._cancel_requests("déconnexion", force=True)
 
-    def _send_message_with_rate_limit(self, c: ServerConnection, target: str, message: str):
-        current_time = time.time()
-        if current_time - self.last_message_time < self.message_rate_limit_delay:
-            sleep_duration = self.message_rate_limit_delay - (current_time - self.last_message_time)
-            logging.debug(f"Rate limit: Attente de {sleep_duration:.2f}s avant d'envoyer le message.")
-            time.sleep(sleep_duration)
-        
-        max_len_irc = 450 # Limite typique, un peu moins pour être sûr avec préfixes, etc.
-        
+    def on_part(self, c: ServerConnection, e: Event):
+        if e.source.nick == c.get_nickname():
+            self._cancel_requests("départ du canal", channel=e.target, force=True)
+        else:
+            self._cancel_requests("départ du canal", channel=e.target, nick=e.source.nick)
+
+    def on_quit(self, c: ServerConnection, e: Event):
+        self._cancel_requests("déconnexion de l'utilisateur", nick=e.source.nick)
+
+    def _send_message_with_rate_limit(self, c: ServerConnection, target: str, message: str, priority: bool = False, budget: ReplyBudget = None):
+        """Découpe le message en lignes IRC et les place dans la file d'envoi (ne bloque jamais).
+
+        Avec `budget`, seules les lignes encore permises partent ; les autres restent dans le budget.
+        """
+        lines = []
         for line in message.splitlines():
             line = line.strip()
-            if not line:
-                continue
-            
-            remaining_line = line
-            while len(remaining_line.encode('utf-8')) > max_len_irc: # Compter les octets pour UTF-8
-                # Trouver la meilleure coupure (espace) en tenant compte de l'encodage
-                part = ""
-                temp_line = ""
-                last_space_idx = -1
-                for i, char_ in enumerate(remaining_line):
-                    temp_line_bytes = (temp_line + char_).encode('utf-8')
-                    if len(temp_line_bytes) > max_len_irc:
-                        break
-                    temp_line += char_
-                    if char_ == ' ':
-                        last_space_idx = i
-                
-                if last_space_idx != -1 and len(temp_line.encode('utf-8')) > max_len_irc * 0.75 : # Couper à l'espace si c'est raisonnable
-                    part = remaining_line[:last_space_idx]
-                    remaining_line = remaining_line[last_space_idx+1:].lstrip()
-                else: # Coupure brutale si pas d'espace ou si la coupure est trop courte
-                    # Trouver le point de coupure en octets
-                    idx_byte_limit = 0
-                    current_byte_len = 0
-                    for i, char_ in enumerate(remaining_line):
-                        char_byte_len = len(char_.encode('utf-8'))
-                        if current_byte_len + char_byte_len > max_len_irc:
-                            break
-                        current_byte_len += char_byte_len
-                        idx_byte_limit = i + 1
-                    part = remaining_line[:idx_byte_limit]
-                    remaining_line = remaining_line[idx_byte_limit:].lstrip()
-
-                logging.debug(f"Envoi (partie): {target} <- {part}")
-                c.privmsg(target, part)
-                self.last_message_time = time.time()
-                if remaining_line:
-                    time.sleep(self.message_rate_limit_delay / 2) # Petite pause entre les parties
-            
-            if remaining_line:
-                logging.debug(f"Envoi (fin): {target} <- {remaining_line}")
-                c.privmsg(target, remaining_line)
-                self.last_message_time = time.time()
+            if line:
+                lines.extend(split_irc_line(line, IRC_MAX_LINE_BYTES))
+        if budget is not None:
+            lines = budget.take(lines)
+        if not lines:
+            return
+        self.outbound.enqueue(target, lines, priority=priority)
+        self.outbound.pump()
 
-    def get_ollama_response(self, user_nick: str, user_prompt: str, channel: str):
-        logging.debug(f"Préparation de la requête Ollama pour [{channel}] <{user_nick}>: {user_prompt}")
-        
-        system_prompt_content = self.ollama_channel_tones.get(channel, self.ollama_default_system_prompt)
-        
-        #ollama_messages = [{"role": "system", "content": system_prompt_content}]
-        prompt = f"{user_nick} dit dans {channel}: {user_prompt}"
-        ollama_messages = [
-            {"role": "system", "content": system_prompt_content},
-            {"role": "user", "content": prompt}
-        ]        
-        channel_hist = conversation_history.get(channel, [])
-        relevant_history = channel_hist[-(self.ollama_context_messages_count -1):] if self.ollama_context_messages_count > 1 else []
+    def _privmsg_now(self, target: str, text: str):
+        # Appelé par la file d'envoi, sur le reactor
+        if not self.connection.is_connected():
+            return
+        logging.debug("Envoi: %s <- %s", target, text, extra={"channel": target})
+        self.connection.privmsg(target, text)
+        self.last_message_time = time.time()
 
-        for hist_entry in relevant_history:
-            # hist_entry est déjà au format {"role": "user/assistant", "name": "nick", "content": "message"}
-            # Pour Ollama, on simplifie le rôle à "user" ou "assistant"
-            # Si "name" est le bot, c'est "assistant", sinon "user".
-            role = "assistant" if hist_entry.get("name") == self.connection.get_nickname() else "user"
-            
-            # Pour les messages "user", Ollama peut bénéficier de savoir qui a parlé.
-            # Cependant, la structure officielle `messages` n'a pas de champ "name" pour le rôle "user".
-            # On préfixe donc le contenu pour les messages utilisateurs.
-            content_with_name = f"{hist_entry.get('name', 'unknown_user')}: {hist_entry.get('content', '')}" if role == "user" else hist_entry.get('content', '')
-            
-            ollama_messages.append({"role": role, "content": content_with_name})
-        
-        # Ajouter le message actuel de l'utilisateur
-        ollama_messages.append({"role": "user", "content": f"{user_nick}: {user_prompt}"})
+    def update_security_config(self, security_config: dict, security_filter: SecurityFilter = None):
+        """Remplace les filtres de sécurité d'un coup (le reactor ne voit jamais un état partiel).
+
+        `security_filter` est le filtre déjà compilé pour cette configuration (cas du rechargement) ; à défaut il est compilé ici.
+        """
+        if security_filter is None:
+            security_filter = SecurityFilter.from_config(security_config)
+        self.security_config, self.security_filter = security_config, security_filter
+
+    def _request_key(self, channel: str, user_prompt: str) -> str:
+        """Clé du cache de réponses (le contexte n'en fait partie que si `include_context` est activé)."""
+        system_prompt_content = self._system_prompt(channel)
+        context = None
+        if self.response_cache and self.response_cache.include_context:
+            relevant_history = self._context_window(channel)
+            context = [[hist_entry.name, hist_entry.content] for hist_entry in relevant_history]
+        return ResponseCache.make_key(self.ollama_model, system_prompt_content, user_prompt, context)
+
+    def _flight_key(self, channel: str, user_prompt: str) -> str:
+        """Clé de fusion des requêtes identiques : canal, prompt système, question normalisée et historique qui la précède.
+
+        Les derniers messages de l'historique qui posent cette même question au bot (ceux de chaque demandeur)
+        sont ignorés : des demandes identiques et rapprochées partagent ainsi la même clé, mais pas deux canaux
+        ou deux moments de la conversation différents.
+        """
+        scope = self._scope(channel)
+        question = ResponseCache.normalize_prompt(user_prompt)
+        nickname = self.connection.get_nickname()
+        entries = conversation_history.recent(scope, conversation_history.capacity)
+        while entries and entries[-1].name != nickname and \
+                ResponseCache.normalize_prompt(self._addressed_prompt(entries[-1].content, nickname)) == question:
+            entries.pop()
+        context = [[hist_entry.name, hist_entry.content, hist_entry.timestamp]
+                   for hist_entry in entries[max(0, len(entries) - self.ollama_context_messages_count):]]
+        key_material = [self.ollama_model, scope, self._system_prompt(channel), question, context]
+        return hashlib.sha256(json.dumps(key_material, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _system_prompt(self, channel: str) -> str:
+        """Prompt système du canal, suivi du résumé des anciens messages s'il y en a un."""
+        scope = self._scope(channel)
+        # Un ton défini pour "réseau/#canal" l'emporte sur celui de "#canal"
+        system_prompt_content = self.ollama_channel_tones.get(scope, self.ollama_channel_tones.get(channel, self.ollama_default_system_prompt))
+        summary = conversation_history.summary(scope)
+        if summary:
+            summary_text = f"Résumé de la conversation précédente sur {channel} : {summary}"
+            return f"{system_prompt_content}\n\n{summary_text}" if system_prompt_content else summary_text
+        return system_prompt_content
+
+    def _context_window(self, channel: str) -> list:
+        """Historique à envoyer : les messages les plus récents qui tiennent dans le budget de jetons du modèle."""
+        return conversation_history.window(self._scope(channel), self.ollama_context_token_budget, self.ollama_context_messages_count - 1)
+
+    def get_ollama_response(self, user_nick: str, user_prompt: str, channel: str, on_chunk=None, cache_key=None, cancel_token=None):
+        """Interroge Ollama et retourne un `OllamaReply`.
+
+        Si `on_chunk` est fourni et que le streaming est activé, les fragments sont transmis
+        au fur et à mesure (`streamed` vaut alors True dans la réponse retournée).
+        Si `cache_key` est fourni, une réponse réussie est enregistrée dans le cache.
+        Si `cancel_token` est annulé ou arrive à échéance, la génération est interrompue.
+        """
+        stream = on_chunk is not None and self.ollama_stream
+        logging.debug("Préparation de la requête Ollama pour [%s] <%s>: %s", channel, user_nick, user_prompt)
+        if cancel_token is not None:
+            metrics.observe("ollama_queue_wait_seconds", time.monotonic() - cancel_token.created_at)
 
+        probe = cancel_token is not None and cancel_token.probe
+        try:
+            # Résumé, mémoire à long terme... peuvent échouer avant tout appel au backend
+            messages = self._build_ollama_messages(user_nick, user_prompt, channel)
+        except Exception:
+            if self.circuit_breaker and probe:
+                self.circuit_breaker.release_probe() # Sinon le disjoncteur attendrait indéfiniment le résultat du test
+            raise
         payload = {
             "model": self.ollama_model,
-            "messages": ollama_messages,
-            "stream": False,
+            "messages": messages,
+            "stream": stream,
             "options": { # Certaines options peuvent être utiles
             "temperature": 0.7,
-                # "num_ctx": 4096 # Taille de la fenêtre de contexte du modèle si besoin d'ajuster
             }
         }
+        if self.ollama_num_ctx:
+            payload["options"]["num_ctx"] = self.ollama_num_ctx # Taille de la fenêtre de contexte du modèle (model_settings)
+        num_predict = self._num_predict(channel)
+        if num_predict:
+            payload["options"]["num_predict"] = num_predict
+        if self.ollama_keep_alive is not None:
+            payload["keep_alive"] = self.ollama_keep_alive
         
-        logging.debug(f"Payload Ollama: {json.dumps(payload, indent=2, ensure_ascii=False)}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG): # json.dumps coûte cher : seulement si le log sera écrit
+            logging.debug("Payload Ollama: %s", json.dumps(payload, indent=2, ensure_ascii=False))
+        started = time.monotonic()
+        first_chunk_at = []
+        def on_stream_chunk(text):
+            if not first_chunk_at:
+                first_chunk_at.append(time.monotonic())
+            on_chunk(text)
         try:
-            response = requests.post(self.ollama_api_url, json=payload, timeout=self.ollama_request_timeout)
-            response.raise_for_status()
-            api_response = response.json()
+            api_response = self.ollama_client.chat(payload, on_chunk=on_stream_chunk if stream else None, cancel_token=cancel_token)
+            # En streaming, la latence surveillée par le disjoncteur est celle du premier fragment
+            self._record_backend_result(True, (first_chunk_at[0] if first_chunk_at else time.monotonic()) - started,
+                                        duration=time.monotonic() - started, stats=api_response, probe=probe)
             
             if "message" in api_response and "content" in api_response["message"]:
                 bot_response = api_response["message"]["content"]
@@ -251,72 +2558,185 @@ class OllamaIRCBot(irc.bot.SingleServerIRCBot):
                 bot_response = api_response["response"]
             else:
                 logging.error(f"Réponse Ollama inattendue: {api_response}")
-                return "Désolé, je n'ai pas pu traiter cette demande (format de réponse Ollama non reconnu)."
+                return OllamaReply("Désolé, je n'ai pas pu traiter cette demande (format de réponse Ollama non reconnu).", ok=False)
 
-            logging.info(f"Réponse d'Ollama: {bot_response}")
-            # On stocke la réponse du bot dans l'historique
-            self._add_to_history(channel, self.connection.get_nickname(), bot_response, role="assistant")
-            return bot_response.strip()
+            logging.info("Réponse d'Ollama%s: %s", " (streaming)" if stream else "", bot_response, extra={"channel": channel})
+            stats = {field: api_response[field] for field in OLLAMA_STAT_FIELDS if field in api_response}
+            if stats:
+                # prompt_eval_count bas d'une requête à l'autre = le préfixe a été réutilisé depuis le cache KV
+                logging.info("Statistiques Ollama [%s]: load_duration=%.0fms, prompt_eval_count=%s, prompt_eval_duration=%.0fms, eval_count=%s, eval_duration=%.0fms",
+                             channel, stats.get('load_duration', 0) / 1e6, stats.get('prompt_eval_count'), stats.get('prompt_eval_duration', 0) / 1e6,
+                             stats.get('eval_count'), stats.get('eval_duration', 0) / 1e6)
+            if stats.get("load_duration", 0) >= 1e9:
+                # Le modèle avait été déchargé : c'est l'utilisateur qui a payé son chargement
+                metrics.inc("ollama_cold_starts_total")
+                logging.info(f"Démarrage à froid de {self.ollama_model} pour [{channel}] : {stats['load_duration'] / 1e9:.1f}s de chargement.")
+            if self.model_warmer:
+                self.model_warmer.touch()
+            if cache_key:
+                self.response_cache.put(cache_key, bot_response.strip())
+            return OllamaReply(bot_response.strip(), streamed=stream, stats=stats)
             
+        except RequestCancelled as e:
+            logging.info(f"Requête de {user_nick} dans {channel} annulée ({e}).")
+            metrics.inc("ollama_requests_total", result="deadline" if cancel_token.reason == CancelToken.DEADLINE else "cancelled")
+            if self.circuit_breaker and probe:
+                self.circuit_breaker.release_probe()
+            if cancel_token.reason == CancelToken.DEADLINE:
+                return OllamaReply("Désolé, mon cerveau (Ollama) met trop de temps à répondre. Réessayez plus tard.", ok=False)
+            return OllamaReply(None, ok=False) # Personne n'attend plus la réponse
         except requests.exceptions.Timeout:
             logging.error(f"Timeout lors de la communication avec l'API Ollama ({self.ollama_api_url}).")
-            return f"Désolé {user_nick}, mon cerveau (Ollama) met trop de temps à répondre. Réessayez plus tard."
+            self._record_backend_result(False, time.monotonic() - started, "timeout", probe=probe)
+            return OllamaReply("Désolé, mon cerveau (Ollama) met trop de temps à répondre. Réessayez plus tard.", ok=False)
         except requests.exceptions.RequestException as e:
             logging.error(f"Erreur de communication avec l'API Ollama ({self.ollama_api_url}): {e}")
-            return f"Désolé {user_nick}, un souci technique m'empêche de contacter mon cerveau (Ollama) : {type(e).__name__}."
+            # Une erreur 4xx (modèle inconnu...) vient de la requête, pas d'une panne du backend
+            client_error = isinstance(e, requests.exceptions.HTTPError) and e.response is not None and e.response.status_code < 500
+            self._record_backend_result(client_error, time.monotonic() - started, type(e).__name__, probe=probe)
+            return OllamaReply(f"Désolé, un souci technique m'empêche de contacter mon cerveau (Ollama) : {type(e).__name__}.", ok=False)
         except Exception as e:
             logging.error(f"Erreur inattendue lors de l'appel à Ollama: {e}", exc_info=True)
-            return "Désolé, une erreur interne est survenue en essayant de générer une réponse."
-        # ... (dans get_ollama_response, après response.raise_for_status())
-        try:
-            api_response = response.json()
-            logging.debug(f"CONTENU BRUT DE LA RÉPONSE JSON D'OLLAMA: {api_response}") # <--- AJOUTER CE LOG
-
-            #bot_response = api_response.get("message", {}).get("content") or api_response.get("response")
-            bot_response = api_response.get("response", "")
-            logging.debug(f"Réponse brute d'Ollama: {response.text}")
-            if not bot_response: # Si bot_response est None ou une chaîne vide
-                logging.error(f"Réponse Ollama valide (code 200) mais contenu attendu (message.content ou response) manquant ou vide. Réponse complète: {api_response}")
-                # On peut même retourner l'erreur d'Ollama si elle existe
-                ollama_error_message = api_response.get("error")
-                if ollama_error_message:
-                    return f"Ollama a retourné une erreur : {ollama_error_message}"
-                return f"Désolé {user_nick}, je n'ai pas pu générer de réponse (contenu vide ou format non reconnu)."
-
-            # Si on arrive ici, bot_response a quelque chose.
-            logging.info(f"Réponse d'Ollama (contenu extrait): {bot_response[:200]}{'...' if len(bot_response) > 200 else ''}")
-            self._add_to_history(channel, self.connection.get_nickname(), bot_response, role="assistant")
-            return bot_response.strip()
-
-        except json.JSONDecodeError: # Si la réponse n'est pas du JSON valide
-            logging.error(f"Impossible de décoder la réponse JSON d'Ollama. Statut HTTP: {response.status_code}. Réponse texte: {response.text[:500]}")
-            return f"Désolé {user_nick}, Ollama a renvoyé une réponse non-JSON."
-        
+            self._record_backend_result(False, time.monotonic() - started, type(e).__name__, probe=probe)
+            return OllamaReply("Désolé, une erreur interne est survenue en essayant de générer une réponse.", ok=False)
+
+    def _reply_lines(self, channel: str) -> int:
+        return self.channel_max_reply_lines.get(channel, self.max_reply_lines)
+
+    def _num_predict(self, channel: str):
+        if self.ollama_num_predict:
+            return self.ollama_num_predict
+        max_lines = self._reply_lines(channel)
+        if max_lines <= 0:
+            return None
+        # Au plus ce que l'on peut afficher (réponse + tampon !more), en lignes IRC pleines
+        return (max_lines + self.paged_replies.max_lines) * estimate_tokens("x" * IRC_MAX_LINE_BYTES)
+
+    def _record_backend_result(self, success: bool, latency: float, error: str = None, duration: float = None, stats: dict = None,
+                               probe: bool = False):
+        """Transmet le résultat d'un appel au disjoncteur et aux métriques (`stats` : champs *_duration d'Ollama)."""
+        if self.circuit_breaker:
+            self.circuit_breaker.record(success, latency, error, probe)
+        metrics.inc("ollama_requests_total", result=error or "ok")
+        metrics.observe("ollama_request_seconds", duration if duration is not None else latency)
+        if not stats:
+            return
+        for field, name in (("load_duration", "ollama_load_seconds"), ("prompt_eval_duration", "ollama_prompt_eval_seconds"),
+                            ("eval_duration", "ollama_generation_seconds")):
+            if stats.get(field):
+                metrics.observe(name, stats[field] / 1e9)
+        metrics.inc("ollama_prompt_tokens_total", stats.get("prompt_eval_count", 0))
+        metrics.inc("ollama_generated_tokens_total", stats.get("eval_count", 0))
+        if stats.get("eval_count") and stats.get("eval_duration"):
+            metrics.observe("ollama_generation_tokens_per_second", stats["eval_count"] / (stats["eval_duration"] / 1e9))
+
+    def _build_ollama_messages(self, user_nick: str, user_prompt: str, channel: str) -> list:
+        system_prompt_content = self._system_prompt(channel)
+
+        if self.ollama_prompt_layout == "prefix_stable":
+            # Système, puis l'historique dans l'ordre (il contient déjà le message actuel) : seule la fin du prompt change
+            relevant_history = conversation_history.stable_window(self._scope(channel), self.ollama_context_token_budget, self.ollama_context_messages_count - 1)
+            ollama_messages = [{"role": "system", "content": system_prompt_content}]
+            ollama_messages.extend(self._history_to_messages(relevant_history))
+            last = relevant_history[-1] if relevant_history else None
+            # L'historique garde le message brut ("pseudo: question") : on compare la question qu'il contient
+            if last is None or last.name != user_nick or self._addressed_prompt(last.content, self.connection.get_nickname()) != user_prompt:
+                ollama_messages.append({"role": "user", "content": f"{user_nick}: {user_prompt}"})
+        else:
+            #ollama_messages = [{"role": "system", "content": system_prompt_content}]
+            prompt = f"{user_nick} dit dans {channel}: {user_prompt}"
+            ollama_messages = [
+                {"role": "system", "content": system_prompt_content},
+                {"role": "user", "content": prompt}
+            ]        
+            relevant_history = self._context_window(channel)
+            ollama_messages.extend(self._history_to_messages(relevant_history))
+            
+            # Ajouter le message actuel de l'utilisateur
+            ollama_messages.append({"role": "user", "content": f"{user_nick}: {user_prompt}"})
+
+        if self.long_term_memory:
+            # Anciens messages proches de la question, juste avant celle-ci (le début du prompt ne change pas)
+            exclude = {(hist_entry.name, hist_entry.content) for hist_entry in relevant_history}
+            exclude.add((user_nick, user_prompt))
+            recalled = self.long_term_memory.recall(self._scope(channel), user_prompt, exclude)
+            if recalled:
+                memory_lines = "\n".join(f"[{time.strftime('%Y-%m-%d', time.localtime(timestamp))}] {name}: {content}"
+                                          for name, content, timestamp in recalled)
+                ollama_messages.insert(len(ollama_messages) - 1, {"role": "system", "content": f"Anciens messages de {channel} pouvant être utiles :\n{memory_lines}"})
+        return ollama_messages
+
+    def _history_to_messages(self, relevant_history: list) -> list:
+        ollama_messages = []
+        for hist_entry in relevant_history:
+            # hist_entry est un HistoryEntry (role, name, content, timestamp)
+            # Pour Ollama, on simplifie le rôle à "user" ou "assistant"
+            # Si "name" est le bot, c'est "assistant", sinon "user".
+            role = "assistant" if hist_entry.name == self.connection.get_nickname() else "user"
+            
+            # Pour les messages "user", Ollama peut bénéficier de savoir qui a parlé.
+            # Cependant, la structure officielle `messages` n'a pas de champ "name" pour le rôle "user".
+            # On préfixe donc le contenu pour les messages utilisateurs.
+            content_with_name = f"{hist_entry.name}: {hist_entry.content}" if role == "user" else hist_entry.content
+            
+            ollama_messages.append({"role": role, "content": content_with_name})
+        return ollama_messages
+
     def _add_to_history(self, channel: str, nick: str, message: str, role: str = "user"):
-        if channel not in conversation_history:
-            conversation_history[channel] = []
-        
-        conversation_history[channel].append({
-            "role": role, 
-            "name": nick, 
-            "content": message, 
-            "timestamp": time.time()
-        })
-        
-        # Limiter la taille de l'historique par canal (nombre total de messages)
-        max_hist_size = self.ollama_context_messages_count * 2 # Un peu plus que le contexte envoyé
-        if len(conversation_history[channel]) > max_hist_size:
-            conversation_history[channel] = conversation_history[channel][-max_hist_size:]
+        # Tampon circulaire : les messages les plus anciens sont éliminés automatiquement
+        scope = self._scope(channel)
+        conversation_history.add(scope, role, nick, message)
+        metrics.inc("irc_messages_ingested_total", channel=channel, role=role, **self.metric_labels)
+        if self.long_term_memory:
+            self.long_term_memory.add(scope, nick, message, time.time())
+        if self.summarizer:
+            self._maybe_summarize(scope)
+
+    def _maybe_summarize(self, channel: str):
+        # `channel` est ici la clé préfixée par le réseau (voir _scope)
+        folded = self.summarizer.candidates(channel)
+        if not folded:
+            return
+        self.summarizer.pending.add(channel)
+        logging.debug("Résumé de %d ancien(s) message(s) de %s en arrière-plan.", len(folded), channel)
+        future = self.dispatcher.submit(self.summarizer.summarize, channel, conversation_history.summary(channel), folded)
+        future.add_done_callback(lambda done: self.dispatcher.call_soon(self._apply_summary, channel, folded, done))
+
+    def _apply_summary(self, channel: str, folded: list, future):
+        # Sur le thread du reactor
+        self.summarizer.pending.discard(channel)
+        try:
+            summary = future.result()
+        except Exception as e:
+            logging.warning(f"Échec du résumé de l'historique de {channel} : {e}")
+            return
+        if not summary:
+            logging.warning(f"Résumé vide pour {channel}, historique conservé tel quel.")
+            return
+        conversation_history.fold(channel, folded, summary)
+        logging.info(f"Historique de {channel} : {len(folded)} message(s) replié(s) dans le résumé ({estimate_tokens(summary)} jetons estimés).")
+
+    def _maintain_history(self):
+        # Appelé périodiquement par le reactor
+        evicted = conversation_history.evict_idle(self.history_idle_ttl)
+        if self.admission:
+            self.admission.prune()
+        self.paged_replies.prune()
+        if evicted:
+            logging.info(f"Historique: {evicted} canal(aux) inactif(s) oublié(s).")
+        if logging.getLogger().isEnabledFor(logging.DEBUG): # Le rapport parcourt tout l'historique
+            memory_report = conversation_history.memory_report()
+            logging.debug("Historique: %d canaux suivis, ~%d Kio. Par canal: %s",
+                          len(memory_report), sum(memory_report.values()) // 1024, memory_report)
 
     def on_pubmsg(self, c: ServerConnection, e: Event):
         user_nick = e.source.nick
         channel = e.target
         message_text = e.arguments[0]
-        logging.debug(f"Message brut reçu: [{channel}] <{user_nick}> {message_text}")  # <-- Nouveau log
-        logging.info(f"[{channel}] <{user_nick}> {message_text}")
+        logging.info("[%s] <%s> %s", channel, user_nick, message_text, extra={"channel": channel})
 
         # Filtrage des nicks bloqués
-        if user_nick in self.security_config.get("blocked_nicks", []):
+        if self.security_filter.is_blocked(user_nick):
             logging.warning(f"Message de {user_nick} (nick bloqué) ignoré dans {channel}.")
             return
 
@@ -328,44 +2748,213 @@ class OllamaIRCBot(irc.bot.SingleServerIRCBot):
         self._add_to_history(channel, user_nick, message_text, role="user")
 
         # Filtrage de spam basique
-        spam_keywords = self.security_config.get("spam_filter_keywords", [])
-        for keyword in spam_keywords:
-            if keyword.lower() in message_text.lower():
-                logging.warning(f"Message de {user_nick} dans {channel} détecté comme spam potentiel (mot-clé: '{keyword}'): {message_text}")
-                # Optionnel: c.kick(channel, user_nick, "Message contenant du spam.")
-                return # Ne pas répondre au spam
+        spam_keyword = self.security_filter.find_spam_keyword(message_text)
+        if spam_keyword is not None:
+            logging.warning(f"Message de {user_nick} dans {channel} détecté comme spam potentiel (mot-clé: '{spam_keyword}'): {message_text}")
+            # Optionnel: c.kick(channel, user_nick, "Message contenant du spam.")
+            return # Ne pas répondre au spam
 
         # Gestion des commandes
         if message_text.startswith(self.command_prefix):
             parts = message_text.split(" ", 1)
             command = parts[0][len(self.command_prefix):].lower()
             args = parts[1] if len(parts) > 1 else ""
-            self.handle_command(c, channel, user_nick, command, args)
+            self.handle_command(c, channel, user_nick, command, args, e.source)
         # Interpellation directe (si le message commence par le pseudo du bot)
         #elif message_text.lower().startswith(c.get_nickname().lower()):
         elif message_text.lower().startswith(c.get_nickname().lower() + ":") or message_text.lower().startswith(c.get_nickname().lower() + ","):
-            prompt = message_text[len(c.get_nickname()):].strip()
-            if prompt and (prompt.startswith(":") or prompt.startswith(",")):
-                prompt = prompt[1:].strip()
+            prompt = self._addressed_prompt(message_text, c.get_nickname())
             
             if prompt: # S'il y a quelque chose après le nom du bot
-                logging.info(f"Interpellation directe par {user_nick} dans {channel}: '{prompt}'")
-                response = self.get_ollama_response(user_nick, prompt, channel)
-                if response:
-                    self._send_message_with_rate_limit(c, channel, f"{user_nick}: {response}")
+                logging.info("Interpellation directe par %s dans %s: '%s'", user_nick, channel, prompt)
+                self._dispatch_ollama_request(c, channel, user_nick, prompt)
             else: # Juste le nom du bot, sans rien d'autre
-                 self._send_message_with_rate_limit(c, channel, f"{user_nick}: Oui ? Vous m'avez appelé ? Essayez '{self.command_prefix}aide' ou posez-moi une question.")
+                 self._send_message_with_rate_limit(c, channel, f"{user_nick}: Oui ? Vous m'avez appelé ? Essayez '{self.command_prefix}aide' ou posez-moi une question.", priority=True)
+
+
+    @staticmethod
+    def _addressed_prompt(message_text: str, nickname: str) -> str:
+        """Ce qui suit "pseudo:" ou "pseudo," en tête du message (chaîne vide s'il ne s'adresse pas au bot)."""
+        lowered, nickname_lower = message_text.lower(), nickname.lower()
+        if not (lowered.startswith(nickname_lower + ":") or lowered.startswith(nickname_lower + ",")):
+            return ""
+        return message_text[len(nickname) + 1:].strip()
+
+    def _dispatch_ollama_request(self, c: ServerConnection, channel: str, user_nick: str, prompt: str):
+        """Met la requête Ollama en file et rend la main immédiatement au reactor."""
+        if self.cancel_on_new_prompt:
+            # Une nouvelle question remplace celle encore en cours du même utilisateur sur ce canal
+            self._cancel_requests("question remplacée", channel=channel, nick=user_nick)
+        seq = self.reply_sequencer.ticket(channel)
+        cache_key = None
+        if self.response_cache and self.response_cache.enabled_for(channel):
+            cache_key = self._request_key(channel, prompt)
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                logging.info("Réponse servie depuis le cache pour [%s] <%s>.", channel, user_nick)
+                self._add_to_history(channel, c.get_nickname(), cached_response, role="assistant")
+                deliver = partial(self._deliver_ollama_response, c, channel, user_nick, f"{user_nick}: {cached_response}",
+                                  ReplyBudget(self._reply_lines(channel)), True)
+                self.reply_sequencer.push(channel, seq, deliver, True)
+                return
+
+        # En streaming, chaque ligne complète part vers le reactor dès qu'elle est prête
+        budget = ReplyBudget(self._reply_lines(channel))
+        line_stream = IrcLineStream(partial(self._on_ollama_line, c, channel, user_nick, seq, budget), prefix=f"{user_nick}: ")
+
+        # Même requête déjà en cours (ex: plusieurs personnes posent la même question) : on attend son résultat
+        flight_key = self._flight_key(channel, prompt) if self.single_flight else None
+        leader = self.single_flight.attach(flight_key) if self.single_flight else None
+        if leader is not None and not leader.cancel_token.cancelled:
+            logging.info("Requête de %s dans %s fusionnée avec une requête identique en cours.", user_nick, channel)
+            leader.cancel_token.holders += 1
+            self._track_request(channel, user_nick, leader.cancel_token)
+            leader.add_done_callback(lambda done: self.dispatcher.call_soon(self._untrack_request, channel, user_nick, done.cancel_token))
+            leader.add_done_callback(partial(self._on_ollama_done, c, channel, user_nick, seq, line_stream, budget))
+            return
+
+        # Backend en panne : réponse immédiate plutôt que d'attendre request_timeout
+        if self.circuit_breaker and not self.circuit_breaker.allow():
+            logging.info(f"Requête de {user_nick} dans {channel} refusée (disjoncteur ouvert).")
+            metrics.inc("ollama_rejections_total", reason="circuit_open")
+            self.reply_sequencer.push(channel, seq, None, True)
+            if not self.admission or self.admission.should_reply_busy(self._scope(channel)):
+                self._send_message_with_rate_limit(c, channel, f"{user_nick}: {self.ollama_unavailable_reply}", priority=True)
+            return
+        # Seul allow(), appelé ici sur le thread du reactor, fait passer en semi-ouvert, et il n'y laisse passer que la requête de test
+        probe = self.circuit_breaker is not None and self.circuit_breaker.state == CircuitBreaker.HALF_OPEN
+
+        rejection = self.admission.admit(self._scope(channel), self._scope(user_nick)) if self.admission else None
+        if rejection:
+            if probe:
+                self.circuit_breaker.release_probe()
+            self._reject_ollama_request(c, channel, user_nick, seq, rejection)
+            return
 
+        started = time.monotonic()
+        cancel_token = CancelToken(self.request_deadline)
+        cancel_token.probe = probe
+        future = self.dispatcher.submit(self.get_ollama_response, user_nick, prompt, channel, line_stream.feed, cache_key, cancel_token)
+        future.cancel_token = cancel_token
+        self._track_request(channel, user_nick, cancel_token)
+        if self.single_flight:
+            self.single_flight.lead(flight_key, future)
+        future.add_done_callback(lambda done: self.dispatcher.call_soon(self._on_request_finished, channel, user_nick, cancel_token, time.monotonic() - started))
+        future.add_done_callback(partial(self._on_ollama_done, c, channel, user_nick, seq, line_stream, budget))
 
-    def handle_command(self, c: ServerConnection, channel: str, nick: str, command: str, args: str):
-        logging.info(f"Commande reçue de {nick} dans {channel}: !{command} {args}")
+    def _on_request_finished(self, channel: str, user_nick: str, cancel_token: CancelToken, duration: float):
+        # Sur le thread du reactor
+        self._untrack_request(channel, user_nick, cancel_token)
+        if self.admission:
+            self.admission.release(self._scope(channel), self._scope(user_nick), duration)
+
+    def _track_request(self, channel: str, user_nick: str, cancel_token: CancelToken):
+        self._active_requests[(channel, irc.strings.lower(user_nick))] = cancel_token
+
+    def _untrack_request(self, channel: str, user_nick: str, cancel_token: CancelToken):
+        key = (channel, irc.strings.lower(user_nick))
+        if self._active_requests.get(key) is cancel_token:
+            del self._active_requests[key]
+
+    def _cancel_requests(self, reason: str, channel: str = None, nick: str = None, force: bool = False):
+        """Annule les requêtes en cours correspondant au canal et/ou au nick (toutes si aucun des deux).
+
+        Sans `force`, une requête fusionnée n'est annulée que si plus personne d'autre ne l'attend.
+        """
+        nick = irc.strings.lower(nick) if nick else None
+        matching = [key for key in self._active_requests
+                    if (channel is None or key[0] == channel) and (nick is None or key[1] == nick)]
+        for key in matching:
+            cancel_token = self._active_requests.pop(key)
+            if force:
+                cancel_token.cancel(reason)
+            else:
+                cancel_token.release(reason)
+            if cancel_token.cancelled:
+                logging.info(f"Requête en cours de {key[1]} dans {key[0]} annulée ({reason}).")
+
+    def _reject_ollama_request(self, c: ServerConnection, channel: str, user_nick: str, seq: int, reason: str):
+        metrics.inc("ollama_rejections_total", reason=reason)
+        logging.info(f"Requête de {user_nick} dans {channel} refusée ({reason}). "
+                     f"En cours: {self.admission.in_flight}, attente estimée: {self.admission.estimated_wait():.0f}s, refus: {self.admission.rejections}")
+        # Le ticket est libéré sans réponse ; le message "occupé" part tout de suite, sans attendre les réponses en cours
+        self.reply_sequencer.push(channel, seq, None, True)
+        if self.admission.should_reply_busy(self._scope(channel)):
+            self._send_message_with_rate_limit(c, channel, f"{user_nick}: Je suis débordé pour le moment, réessayez dans un instant.", priority=True)
+
+    def _on_ollama_line(self, c: ServerConnection, channel: str, user_nick: str, seq: int, budget: ReplyBudget, line: str):
+        # Appelé dans le thread du worker pendant le streaming
+        deliver = partial(self._deliver_ollama_response, c, channel, user_nick, line, budget)
+        self.dispatcher.call_soon(self.reply_sequencer.push, channel, seq, deliver, False)
+
+    def _on_ollama_done(self, c: ServerConnection, channel: str, user_nick: str, seq: int, line_stream, budget: ReplyBudget, future):
+        # Appelé dans le thread du worker : on ne fait que transmettre au reactor
+        try:
+            reply = future.result()
+        except Exception as e:
+            logging.error(f"Erreur inattendue dans le worker Ollama: {e}", exc_info=True)
+            reply = OllamaReply("Désolé, une erreur interne est survenue en essayant de générer une réponse.", ok=False)
+        if not reply.ok and reply.text is None:
+            # Annulée : personne n'attend plus la réponse, pas même les lignes déjà streamées encore en attente
+            line_stream.discard()
+            self.dispatcher.call_soon(self.reply_sequencer.discard, channel, seq)
+            return
+        line_stream.flush()
+        if reply.ok and reply.text:
+            # Chaque demandeur (y compris ceux d'une requête fusionnée) a reçu sa réponse sur le canal : elle entre dans l'historique
+            self.dispatcher.call_soon(self._add_to_history, channel, c.get_nickname(), reply.text, "assistant")
+        # Si la réponse a déjà été streamée sur ce flux, il n'y a plus rien à envoyer
+        response = None if reply.streamed and line_stream.lines_sent else reply.text
+        if response and line_stream.lines_sent == 0:
+            response = f"{user_nick}: {response}"
+        deliver = partial(self._deliver_ollama_response, c, channel, user_nick, response, budget, True)
+        self.dispatcher.call_soon(self.reply_sequencer.push, channel, seq, deliver, True)
+
+    def _deliver_ollama_response(self, c: ServerConnection, channel: str, user_nick: str, response: str, budget: ReplyBudget = None, final: bool = False):
+        if not c.is_connected():
+            if response:
+                logging.warning(f"Réponse pour {user_nick} dans {channel} abandonnée: connexion IRC perdue.")
+            return
+        if response:
+            self._send_message_with_rate_limit(c, channel, response, budget=budget)
+        if final and budget is not None and budget.overflow:
+            # Réponse trop longue pour le budget du canal : la suite attend !more
+            kept = self.paged_replies.store(channel, user_nick, budget.overflow)
+            self._send_message_with_rate_limit(c, channel, f"{user_nick}: (suite : {kept} ligne(s), tapez {self.command_prefix}more)")
+
+    def _send_more(self, c: ServerConnection, channel: str, nick: str):
+        page, remaining = self.paged_replies.next_page(channel, nick, max(1, self._reply_lines(channel)))
+        if not page:
+            self._send_message_with_rate_limit(c, channel, f"{nick}: Rien de plus en attente.", priority=True)
+            return
+        page[0] = f"{nick}: {page[0]}"
+        if remaining:
+            page.append(f"(encore {remaining} ligne(s), tapez {self.command_prefix}more)")
+        self._send_message_with_rate_limit(c, channel, "\n".join(page))
+
+    def handle_command(self, c: ServerConnection, channel: str, nick: str, command: str, args: str, source: str = None):
+        logging.info("Commande reçue de %s dans %s: !%s %s", nick, channel, command, args)
         if command == "aide" or command == "help":
             self._send_message_with_rate_limit(c, channel, 
-                f"{nick}: Commandes disponibles: {self.command_prefix}ping, {self.command_prefix}aide, {self.command_prefix}info. "
+                f"{nick}: Commandes disponibles: {self.command_prefix}ping, {self.command_prefix}aide, {self.command_prefix}info, {self.command_prefix}etat, {self.command_prefix}more. "
                 f"Pour discuter, mentionnez mon pseudo ({c.get_nickname()}) suivi de votre message."
             )
         elif command == "ping":
-            self._send_message_with_rate_limit(c, channel, f"{nick}: Pong!")
+            self._send_message_with_rate_limit(c, channel, f"{nick}: Pong!", priority=True)
+        elif command == "more" or command == "suite":
+            self._send_more(c, channel, nick)
+        elif command == "etat" or command == "status":
+            self._send_message_with_rate_limit(c, channel, f"{nick}: {self._status_text()}", priority=True)
+        elif command == "reload" or command == "recharger":
+            if not self._is_admin(source):
+                self._send_message_with_rate_limit(c, channel, f"{nick}: Commande réservée aux administrateurs.", priority=True)
+                return
+            try:
+                report = self.reload_config() if self.reload_config else reload_config([self])
+            except Exception as e:
+                logging.error(f"Erreur inattendue lors du rechargement de la configuration: {e}", exc_info=True)
+                report = f"Rechargement interrompu : {e}."
+            self._send_message_with_rate_limit(c, channel, f"{nick}: {report}", priority=True)
         elif command == "info" or command == "source":
             self._send_message_with_rate_limit(c, channel, 
                 f"{nick}: Je suis un chatbot Python utilisant Ollama (modèle: {self.ollama_model}). "
@@ -381,6 +2970,22 @@ class OllamaIRCBot(irc.bot.SingleServerIRCBot):
         else:
             self._send_message_with_rate_limit(c, channel, f"{nick}: Commande '{command}' inconnue. Tapez {self.command_prefix}aide pour la liste des commandes.")
     
+    def _collect_metrics(self):
+        """Valeurs instantanées propres à cette connexion, exportées par l'endpoint de métriques."""
+        yield "irc_send_queue_depth", "gauge", "Lignes en attente dans la file d'envoi IRC", self.metric_labels, self.outbound.depth()
+        yield "irc_send_dropped_total", "counter", "Lignes abandonnées car la file d'envoi d'une cible était pleine", self.metric_labels, self.outbound.dropped
+        if self.single_flight:
+            yield "ollama_coalesced_total", "counter", "Requêtes fusionnées avec une requête identique en cours", self.metric_labels, self.single_flight.coalesced
+
+    def _status_text(self) -> str:
+        """État du backend Ollama et de la file des requêtes, pour la commande !etat."""
+        parts = [f"Ollama ({self.ollama_model}) : " + (self.circuit_breaker.status() if self.circuit_breaker else "disjoncteur désactivé")]
+        if self.admission:
+            latency = f"{self.admission.avg_latency:.1f}s" if self.admission.avg_latency is not None else "inconnue"
+            refused = sum(self.admission.rejections.values())
+            parts.append(f"{self.admission.in_flight} requête(s) en cours, durée moyenne {latency}, {refused} refusée(s) pour surcharge")
+        return ". ".join(parts) + "."
+
     def on_ctcp(self, c: ServerConnection, e: Event):
         """Répond aux requêtes CTCP courantes comme VERSION."""
         nick = e.source.nick
@@ -393,71 +2998,288 @@ class OllamaIRCBot(irc.bot.SingleServerIRCBot):
                 c.ctcp_reply(nick, f"PING {e.arguments[1]}")
 
 
+def load_network_configs(cfg: dict = None) -> list:
+    """Réseaux IRC à rejoindre : la liste `networks`, ou à défaut la seule section `irc`.
+
+    Chaque entrée de `networks` hérite des réglages de la section `irc` qu'elle ne redéfinit pas ;
+    son nom (`name`, par défaut le serveur) préfixe les clés d'historique de ses canaux.
+    """
+    cfg = config if cfg is None else cfg
+    irc_cfg = cfg.get("irc", {})
+    networks = cfg.get("networks")
+    if not networks:
+        return [dict(irc_cfg, name=None)]
+    return [{**irc_cfg, **network, "name": network.get("name") or network.get("server")} for network in networks]
+
+
+def usable_networks() -> list:
+    """Réseaux de la configuration courante qui ont les paramètres indispensables ; les autres sont signalés et ignorés."""
+    networks = []
+    for network_cfg in load_network_configs():
+        if not all([network_cfg.get("server"), network_cfg.get("port") is not None, network_cfg.get("nickname"), network_cfg.get("channels")]): # port peut être 0, donc `is not None`
+            logging.critical(f"Paramètres IRC essentiels manquants (server, port, nickname, channels) pour le réseau {network_cfg['name'] or 'principal'}. Réseau ignoré.")
+            continue
+        networks.append(network_cfg)
+    return networks
+
+
+# Réglages relus à chaud par OllamaIRCBot._load_settings ; les autres clés de ces sections demandent un redémarrage
+HOT_RELOADABLE_SETTINGS = {
+    "ollama": {"model", "model_settings", "default_system_prompt", "channel_tones", "context_messages_count", "context_token_budget",
+               "num_ctx", "prompt_layout", "num_predict", "stream_responses", "request_deadline", "cancel_on_new_prompt", "keep_alive"},
+    "bot_settings": {"log_level", "irc_log_level", "message_rate_limit_delay", "max_reply_lines", "channel_max_reply_lines", "history_idle_ttl"},
+}
+# Clés d'un réseau qui imposent une nouvelle connexion (les canaux, eux, sont rejoints ou quittés à chaud)
+NETWORK_RESTART_KEYS = ("server", "port", "use_ssl", "nickname", "realname", "password", "nickserv_password", "sasl")
+
+
+def validate_config(candidate) -> list:
+    """Retourne les problèmes qui empêchent d'utiliser cette configuration (liste vide si elle est valide)."""
+    if not isinstance(candidate, dict):
+        return ["la racine doit être un objet JSON"]
+    errors = [f"la section '{section}' doit être un objet" for section in ("irc", "ollama", "bot_settings", "security")
+              if not isinstance(candidate.get(section, {}), dict)]
+    if not isinstance(candidate.get("networks", []), list):
+        errors.append("'networks' doit être une liste")
+    if errors:
+        return errors
+    ollama_cfg = candidate.get("ollama", {})
+    bot_cfg = candidate.get("bot_settings", {})
+    for key in ("channel_tones", "model_settings", "circuit_breaker"):
+        if not isinstance(ollama_cfg.get(key, {}), dict):
+            errors.append(f"ollama.{key} doit être un objet")
+    if not isinstance(bot_cfg.get("channel_max_reply_lines", {}), dict):
+        errors.append("bot_settings.channel_max_reply_lines doit être un objet")
+    if errors:
+        return errors
+    if not ollama_cfg.get("model") or not isinstance(ollama_cfg.get("model"), str):
+        errors.append("ollama.model manquant")
+
+    # Valeurs lues à chaque message : une seule de mauvais type ferait échouer toutes les requêtes du canal
+    def is_count(value) -> bool:
+        return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+    def is_integer(value) -> bool:
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def is_amount(value) -> bool:
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+    checks = [("ollama.context_messages_count", ollama_cfg.get("context_messages_count"), is_count, "un entier positif"),
+              ("ollama.context_token_budget", ollama_cfg.get("context_token_budget"), is_amount, "un nombre positif"),
+              ("ollama.num_ctx", ollama_cfg.get("num_ctx"), is_count, "un entier positif"),
+              ("ollama.num_predict", ollama_cfg.get("num_predict"), is_integer, "un entier"),
+              ("ollama.request_timeout", ollama_cfg.get("request_timeout"), is_amount, "un nombre positif"),
+              ("ollama.request_deadline", ollama_cfg.get("request_deadline"), is_amount, "un nombre positif"),
+              ("ollama.default_system_prompt", ollama_cfg.get("default_system_prompt"), lambda value: isinstance(value, str), "une chaîne"),
+              ("ollama.circuit_breaker.unavailable_reply", ollama_cfg.get("circuit_breaker", {}).get("unavailable_reply"),
+               lambda value: isinstance(value, str), "une chaîne"),
+              ("bot_settings.message_rate_limit_delay", bot_cfg.get("message_rate_limit_delay"), is_amount, "un nombre positif"),
+              ("bot_settings.max_reply_lines", bot_cfg.get("max_reply_lines"), is_count, "un entier positif"),
+              ("bot_settings.history_idle_ttl", bot_cfg.get("history_idle_ttl"), is_amount, "un nombre positif")]
+    checks += [(f"ollama.channel_tones.{channel}", tone, lambda value: isinstance(value, str), "une chaîne")
+               for channel, tone in ollama_cfg.get("channel_tones", {}).items()]
+    checks += [(f"bot_settings.channel_max_reply_lines.{channel}", lines, is_count, "un entier positif")
+               for channel, lines in bot_cfg.get("channel_max_reply_lines", {}).items()]
+    for model, settings in ollama_cfg.get("model_settings", {}).items():
+        if not isinstance(settings, dict):
+            errors.append(f"ollama.model_settings.{model} doit être un objet")
+            continue
+        checks += [(f"ollama.model_settings.{model}.context_token_budget", settings.get("context_token_budget"), is_amount, "un nombre positif"),
+                   (f"ollama.model_settings.{model}.num_ctx", settings.get("num_ctx"), is_count, "un entier positif"),
+                   (f"ollama.model_settings.{model}.num_predict", settings.get("num_predict"), is_integer, "un entier")]
+    for key in ("log_level", "irc_log_level"):
+        checks.append((f"bot_settings.{key}", bot_cfg.get(key), lambda value: isinstance(value, str), "une chaîne"))
+    errors.extend(f"{name} doit être {expected}" for name, value, valid, expected in checks if value is not None and not valid(value))
+    for network_cfg in load_network_configs(candidate):
+        label = network_cfg["name"] or "irc"
+        missing = [key for key in ("server", "port", "nickname", "channels") if network_cfg.get(key) in (None, "", [])]
+        if missing:
+            errors.append(f"{label} : {', '.join(missing)} manquant(s)")
+        if not isinstance(network_cfg.get("channels", []), list) or not isinstance(network_cfg.get("admins", []), list):
+            errors.append(f"{label} : 'channels' et 'admins' doivent être des listes")
+        try:
+            SecurityFilter.from_config(network_cfg.get("security", candidate.get("security", {})))
+        except (AttributeError, TypeError) as e:
+            errors.append(f"{label} : section security invalide ({e})")
+    return errors
+
+
+def restart_required_changes(old: dict, new: dict) -> list:
+    """Changements entre deux configurations qui ne peuvent pas être appliqués à chaud."""
+    changes = []
+    for section, reloadable in HOT_RELOADABLE_SETTINGS.items():
+        old_section, new_section = old.get(section, {}), new.get(section, {})
+        for key in sorted(set(old_section) | set(new_section)):
+            if key not in reloadable and old_section.get(key) != new_section.get(key):
+                changes.append(f"{section}.{key}")
+    old_networks = {network_cfg["name"]: network_cfg for network_cfg in load_network_configs(old)}
+    new_networks = {network_cfg["name"]: network_cfg for network_cfg in load_network_configs(new)}
+    for name in sorted(set(old_networks) | set(new_networks), key=str):
+        label = name or "irc"
+        if name not in new_networks or name not in old_networks:
+            changes.append(f"réseau {label} {'retiré' if name not in new_networks else 'ajouté'}")
+            continue
+        changes.extend(f"{label}.{key}" for key in NETWORK_RESTART_KEYS if old_networks[name].get(key) != new_networks[name].get(key))
+    return changes
+
+
+def reload_config(bots: list) -> str:
+    """Relit le fichier de configuration et l'applique aux bots en cours, sans reconnexion.
+
+    Le fichier est entièrement validé et les changements préparés avant de toucher quoi que ce soit :
+    un fichier invalide laisse les bots intacts. À appeler sur le thread du reactor ; retourne un compte rendu.
+    """
+    global config
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            new_config = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"Rechargement de la configuration refusé : '{CONFIG_FILE}' illisible ({e}).")
+        return f"Rechargement refusé : fichier illisible ({e})."
+    errors = validate_config(new_config)
+    if errors:
+        logging.error(f"Rechargement de la configuration refusé : {'; '.join(errors)}")
+        return f"Rechargement refusé : {'; '.join(errors)}."
+
+    networks = {network_cfg["name"]: network_cfg for network_cfg in load_network_configs(new_config)}
+    try:
+        commits = [bot.prepare_reload(new_config, networks[bot.network]) for bot in bots if bot.network in networks]
+        log_levels = resolve_log_levels(new_config.get("bot_settings", {}))
+    except (AttributeError, TypeError, ValueError) as e:
+        # Un type inattendu dans une sous-section que validate_config ne connaît pas
+        logging.error(f"Rechargement de la configuration refusé : valeur invalide ({e}).")
+        return f"Rechargement refusé : valeur invalide ({e})."
+    restart_needed = restart_required_changes(config, new_config)
+
+    # Point de non-retour : uniquement des remplacements de références, sur le thread du reactor
+    changes = [change for commit in commits for change in commit()]
+    apply_log_levels(log_levels)
+    config = new_config
+
+    logging.info(f"Configuration rechargée depuis '{CONFIG_FILE}'. Changements : {', '.join(changes) or 'réglages relus'}.")
+    report = f"Configuration rechargée ({', '.join(changes) or 'réglages relus'})."
+    if restart_needed:
+        logging.warning(f"Changements ignorés jusqu'au prochain redémarrage : {', '.join(restart_needed)}")
+        report += f" Redémarrage nécessaire pour : {', '.join(restart_needed)}."
+    return report
+
+
 def main():
     load_config()
     setup_logging()
 
-    irc_cfg = config.get("irc", {})
     bot_cfg = config.get("bot_settings", {})
 
-    server = irc_cfg.get("server")
-    port = irc_cfg.get("port")
-    use_ssl = irc_cfg.get("use_ssl", False)
-    nickname = irc_cfg.get("nickname")
-    realname = irc_cfg.get("realname", nickname)
-    channels = irc_cfg.get("channels", [])
-    server_password = irc_cfg.get("password") # Renommé pour clarté
-    nickserv_password = irc_cfg.get("nickserv_password")
-
-    if not all([server, port is not None, nickname, channels]): # port peut être 0, donc `is not None`
-        logging.critical("Paramètres IRC essentiels manquants dans la configuration (server, port, nickname, channels). Arrêt.")
+    if not usable_networks():
+        logging.critical("Aucun réseau IRC correctement configuré. Arrêt.")
         return
 
     reconnect_min_delay = bot_cfg.get("reconnect_min_delay", 15)
     reconnect_max_delay = bot_cfg.get("reconnect_max_delay", 300)
-    reconnect_attempts_config = bot_cfg.get("reconnect_attempts", 10) # 0 ou négatif pour infini
+    # Les reconnexions au serveur sont gérées par chaque bot (FastReconnect) ; cette boucle ne relance
+    # le reactor qu'après une erreur inattendue, avec le même nombre maximum d'essais (0 ou négatif pour infini)
+    reconnect_attempts_config = bot_cfg.get("reconnect_attempts", 10)
     
     current_reconnect_delay = reconnect_min_delay
     attempts = 0
 
+    ollama_cfg = config.get("ollama", {})
+    # Historique persistant (optionnel) : écrit par lots, relu canal par canal au premier message
+    history_store = HistoryStore.from_config(bot_cfg.get("history_store", {}))
+    if history_store:
+        atexit.register(history_store.close)
+    conversation_history.configure(
+        capacity=bot_cfg.get("history_max_messages", ollama_cfg.get("context_messages_count", 5) * 2), # Un peu plus que le contexte envoyé
+        max_channels=bot_cfg.get("history_max_channels", 1000),
+        store=history_store,
+    )
+
+    # Tout ce qui suit est créé une seule fois, réutilisé à chaque reconnexion et partagé par tous les réseaux
+    # Pool de workers Ollama
+    dispatcher = OllamaDispatcher(config.get("ollama", {}).get("worker_threads", 4))
+    # Client HTTP Ollama et son pool de connexions keep-alive
+    ollama_client = OllamaClient.from_config(config.get("ollama", {}))
+    ollama_client.start_health_checks()
+    # Admission et disjoncteur : une seule file et un seul état pour le backend, quel que soit le réseau
+    admission = AdmissionController.from_config(ollama_cfg)
+    circuit_breaker = CircuitBreaker.from_config(ollama_cfg)
+    # Endpoint de métriques Prometheus (optionnel), indépendant des reconnexions
+    try:
+        start_metrics_server(bot_cfg.get("metrics", {}))
+    except OSError as e:
+        logging.error(f"Impossible de démarrer le serveur de métriques: {e}")
+    # Le cache de réponses survit aux reconnexions ; sauvegardé sur disque à l'arrêt si persist_file est configuré
+    response_cache = ResponseCache.from_config(config.get("ollama", {}).get("response_cache", {}))
+    if response_cache:
+        atexit.register(response_cache.save)
+    # La mémoire à long terme aussi ; ses index sont écrits sur disque à l'arrêt
+    long_term_memory = EmbeddingMemory.from_config(config.get("ollama", {}), ollama_client, dispatcher)
+    if long_term_memory:
+        atexit.register(long_term_memory.close)
+    # Préchargement du modèle dès maintenant, en parallèle de la connexion IRC ; gardé chargé ensuite
+    model_warmer = ModelWarmer.from_config(ollama_cfg, ollama_client)
+    if model_warmer:
+        model_warmer.request(dispatcher, "démarrage")
+
+    bots = [] # Bots de la tentative de connexion en cours (rempli à chaque tour de boucle)
+    if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread(): # SIGHUP absent sous Windows
+        # Le handler ne fait que demander le rechargement au reactor (SimpleQueue.put peut être appelé depuis un signal)
+        signal.signal(signal.SIGHUP, lambda signum, frame: dispatcher.call_soon(reload_config, bots))
+
     while True:
-        if reconnect_attempts_config > 0 and attempts >= reconnect_attempts_config:
-            logging.critical(f"Nombre maximum de tentatives de reconnexion ({reconnect_attempts_config}) atteint. Arrêt du bot.")
-            break
-        
-        bot = None # S'assurer que bot est réinitialisé
+        bots.clear() # S'assurer que les bots sont réinitialisés
         try:
-            logging.info(f"Tentative de connexion à {server}:{port} (essai {attempts + 1})...")
-            bot = OllamaIRCBot(
-                channels, nickname, server, port, 
-                use_ssl=use_ssl, 
-                realname=realname, 
-                server_password=server_password, 
-                nickserv_password=nickserv_password
-            )
+            # Un seul reactor (une seule boucle select) pour toutes les connexions
+            reactor = IRCReactor()
+            schedule_shared_tasks(reactor, dispatcher, long_term_memory, ollama_cfg, model_warmer)
+            for network_cfg in usable_networks(): # Relu à chaque tentative : la configuration a pu être rechargée
+                nickname = network_cfg.get("nickname")
+                logging.info(f"Tentative de connexion à {network_cfg.get('server')}:{network_cfg.get('port')}...")
+                bots.append(OllamaIRCBot(
+                    network_cfg.get("channels", []), nickname, network_cfg.get("server"), network_cfg.get("port"),
+                    use_ssl=network_cfg.get("use_ssl", False),
+                    realname=network_cfg.get("realname", nickname),
+                    server_password=network_cfg.get("password"), # Renommé pour clarté
+                    nickserv_password=network_cfg.get("nickserv_password"),
+                    dispatcher=dispatcher,
+                    ollama_client=ollama_client,
+                    response_cache=response_cache,
+                    long_term_memory=long_term_memory,
+                    network=network_cfg["name"],
+                    security_config=network_cfg.get("security"), # Sinon la section `security` globale
+                    command_prefix=network_cfg.get("command_prefix"),
+                    reactor=reactor,
+                    admission=admission,
+                    circuit_breaker=circuit_breaker,
+                    admins=network_cfg.get("admins", []),
+                    sasl_config=network_cfg.get("sasl", {}),
+                    model_warmer=model_warmer,
+                ))
+                bots[-1].reload_config = partial(reload_config, bots)
             # bot.load_modules_if_any() # Si vous implémentez un système de modules
-            bot.start() # Bloquant jusqu'à la déconnexion ou une erreur fatale interne à la lib
+            for bot in bots:
+                bot._connect() # Comme SingleServerIRCBot.start(), sans lancer la boucle : elle est commune
+            reactor.process_forever() # Bloquant ; chaque bot se reconnecte seul s'il perd son serveur
             
-            # Si bot.start() se termine "normalement" (déconnexion propre ou kick non géré pour rejoin)
-            logging.warning("Le bot s'est arrêté ou a été déconnecté. Tentative de reconnexion...")
-            # Réinitialiser le délai après une déconnexion "normale"
-            current_reconnect_delay = reconnect_min_delay
-            # On ne compte pas cela comme une tentative de reconnexion "ratée"
-            # attempts +=1 # Décommentez si vous voulez compter chaque déconnexion
-
-        except (irc.client.ServerConnectionError, ConnectionRefusedError, ssl.SSLError, TimeoutError) as e:
-            logging.error(f"Erreur de connexion au serveur IRC: {e}. Nouvelle tentative...")
-            attempts += 1
+            # La boucle ne s'arrête que lorsque tous les réseaux ont épuisé leurs tentatives de reconnexion
+            logging.critical("Aucun réseau IRC n'a pu être rejoint après le nombre maximum de tentatives. Arrêt du bot.")
+            break
+
         except Exception as e:
             logging.critical(f"Une erreur critique non gérée est survenue dans la boucle principale: {e}", exc_info=True)
             attempts += 1
-            # Il pourrait être sage d'arrêter le bot ici si l'erreur est vraiment inconnue/grave.
-            # break 
+        if reconnect_attempts_config > 0 and attempts >= reconnect_attempts_config:
+            logging.critical(f"Nombre maximum de redémarrages ({reconnect_attempts_config}) atteint. Arrêt du bot.")
+            break
         
-        if bot and bot.connection.connected: # Si une erreur s'est produite mais que la connexion est toujours active (peu probable ici)
-            bot.disconnect("Arrêt suite à une erreur et tentative de redémarrage.")
+        for bot in bots:
+            if bot.connection.connected: # Si une erreur s'est produite mais que la connexion est toujours active
+                bot.disconnect("Arrêt suite à une erreur et tentative de redémarrage.")
         
-        logging.info(f"Attente de {current_reconnect_delay} secondes avant la prochaine tentative.")
+        logging.info(f"Attente de {current_reconnect_delay} secondes avant de relancer les connexions.")
+        for bot in bots: # Mêmes labels que les reconnexions de FastReconnect : une par réseau relancé
+            metrics.inc("irc_reconnects_total", **bot.metric_labels)
         time.sleep(current_reconnect_delay)
         # Augmenter le délai pour la prochaine fois (backoff exponentiel simple)
         current_reconnect_delay = min(current_reconnect_delay * 2, reconnect_max_delay)
@@ -465,6 +3287,9 @@ def main():
         current_reconnect_delay += random.randint(0, int(current_reconnect_delay * 0.1))
         current_reconnect_delay = min(current_reconnect_delay, reconnect_max_delay)
 
+    dispatcher.shutdown()
+    ollama_client.close()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file